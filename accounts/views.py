@@ -6,6 +6,7 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserUpdateForm, ProfileUpdateForm
+from music.history import recent_plays_for
 
 def register_view(request):
     if request.method == 'POST':
@@ -60,6 +61,7 @@ def profile_view(request):
     
     context = {
         'user_form': user_form,
-        'profile_form': profile_form
+        'profile_form': profile_form,
+        'recent_plays': recent_plays_for(request.user, limit=5),
     }
     return render(request, 'accounts/profile.html', context)
\ No newline at end of file
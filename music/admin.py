@@ -20,7 +20,7 @@ class SongAdmin(admin.ModelAdmin):
             'fields': ('lyrics', 'lyrics_source')
         }),
         ('Metadata', {
-            'fields': ('duration', 'is_active')
+            'fields': ('duration_seconds', 'is_active')
         }),
         ('Statistics', {
             'fields': ('plays_count', 'likes_count')
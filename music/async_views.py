@@ -0,0 +1,122 @@
+"""
+Async variants of the I/O-bound views, routed in place of the sync ones when
+ASYNC_VIEWS is on (the ASGI profile, see music_player/asgi.py).
+
+ORM access uses the async query API or runs in Django's thread-sensitive
+executor; template rendering stays sync because context processors and
+templates touch the database lazily. Audio is streamed from an async
+iterator, so a listener costs an open file and a coroutine, not a thread.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import render
+
+from .buffers import play_buffer
+from .history import recent_plays
+from .likes import apply_likes, parse_action
+from .models import Song, UserSongInteraction
+from .search import get_search_backend
+from .similarity import similar_songs_for
+from .transcode import pick_rendition, requested_codecs, requested_quality
+from .views import audio_response
+
+
+async def get_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def is_authenticated(request):
+    """Resolve the lazy request.user off the event loop; it's cached afterwards"""
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+async def song_detail(request, song_id):
+    """Display song details with lyrics"""
+    song = await get_or_404(Song.objects.select_related('artist', 'album'), id=song_id, is_active=True)
+    user_id = request.user.id if await is_authenticated(request) else None
+
+    # Recording may flush a batch, so it runs where the ORM is allowed
+    await sync_to_async(play_buffer.record)(song.id, user_id)
+
+    is_liked = False
+    if user_id is not None:
+        await sync_to_async(recent_plays.record)(user_id, song.id)
+        is_liked = await UserSongInteraction.objects.filter(user_id=user_id, song=song, is_liked=True).aexists()
+
+    similar_songs = await sync_to_async(similar_songs_for)(song, limit=5)
+
+    context = {
+        'song': song,
+        'similar_songs': similar_songs,
+        'is_liked': is_liked,
+    }
+    return await sync_to_async(render)(request, 'music/song_detail.html', context)
+
+
+async def stream_song(request, song_id):
+    """Stream a song's audio (or a rendition of it) with HTTP Range support"""
+    song = await get_or_404(Song.objects.all(), id=song_id, is_active=True)
+    if not song.audio_file:
+        raise Http404('Song has no audio file')
+
+    rendition = await sync_to_async(pick_rendition)(song, requested_quality(request), requested_codecs(request))
+    # Only file system calls from here on; keep them out of the ORM's thread
+    return await sync_to_async(audio_response, thread_sensitive=False)(
+        request, song, rendition, asynchronous=True
+    )
+
+
+async def search(request):
+    """Search for songs, artists, and albums"""
+    query = request.GET.get('q', '')
+
+    if query:
+        results = await sync_to_async(get_search_backend().search)(query, page=request.GET.get('page'))
+        context = {
+            'query': query,
+            'songs': results['songs'],
+            'artists': results['artists'],
+            'albums': results['albums'],
+        }
+    else:
+        context = {
+            'query': '',
+            'songs': [],
+            'artists': [],
+            'albums': [],
+        }
+
+    return await sync_to_async(render)(request, 'music/search.html', context)
+
+
+async def like_song(request):
+    """AJAX view to like/unlike a song"""
+    # login_required and require_POST only wrap sync views in Django 4.2
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not await is_authenticated(request):
+        return redirect_to_login(request.get_full_path())
+
+    try:
+        data = json.loads(request.body)
+        song_id = int(data.get('song_id'))
+        liked = parse_action(data.get('action'))  # 'like' or 'unlike'
+
+        if not await Song.objects.filter(id=song_id).aexists():
+            raise Http404('No Song matches the given query.')
+        results = await sync_to_async(apply_likes)(request.user, {song_id: liked})
+        result = results[song_id]
+
+        return JsonResponse({
+            'success': True,
+            'likes_count': result['likes_count'],
+            'is_liked': result['is_liked']
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
@@ -0,0 +1,144 @@
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.urls import reverse
+
+from .cache import catalogue_version
+from .models import Album, Artist, Song
+
+
+def normalize(text):
+    """Case- and accent-insensitive form used for index keys and lookups"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).strip()
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, kind, pk) tuples searched with bisect.
+
+    Every label is indexed under each of its word suffixes ("crazy in love",
+    "in love", "love") so a prefix matches the start of any word. Lookups are
+    O(log n + k) and never touch the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = []
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def index_keys(self, label):
+        words = normalize(label).split()
+        return tuple(' '.join(words[i:]) for i in range(len(words)))
+
+    def add(self, kind, pk, label, url):
+        keys = self.index_keys(label)
+        with self.lock:
+            self._remove(kind, pk)
+            for key in keys:
+                insort(self.keys, (key, kind, pk))
+            self.entries[(kind, pk)] = {'type': kind, 'id': pk, 'label': label, 'url': url, 'keys': keys}
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self._remove(kind, pk)
+
+    def _remove(self, kind, pk):
+        entry = self.entries.pop((kind, pk), None)
+        if entry is None:
+            return
+        for key in entry['keys']:
+            i = bisect_left(self.keys, (key, kind, pk))
+            if i < len(self.keys) and self.keys[i] == (key, kind, pk):
+                del self.keys[i]
+
+    def lookup(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        matches = {}
+        with self.lock:
+            i = bisect_left(self.keys, (prefix,))
+            while i < len(self.keys) and len(matches) < limit * 4:
+                key, kind, pk = self.keys[i]
+                if not key.startswith(prefix):
+                    break
+                entry = self.entries[(kind, pk)]
+                # Matching the start of the label beats matching a later word
+                rank = (key != entry['keys'][0], len(entry['label']))
+                if (kind, pk) not in matches or rank < matches[(kind, pk)][0]:
+                    matches[(kind, pk)] = (rank, entry)
+                i += 1
+        ranked = sorted(matches.values(), key=lambda match: match[0])
+        return [
+            {field: entry[field] for field in ('type', 'id', 'label', 'url')}
+            for _, entry in ranked[:limit]
+        ]
+
+
+class AutocompleteIndex(PrefixIndex):
+    """
+    Prefix index over song titles, artist names and album titles.
+
+    Each process holds its own copy. Signals keep it current for changes made
+    by this process; changes made elsewhere (other web workers, bulk imports)
+    bump the catalogue version in the shared cache, and the next lookup then
+    rebuilds the index from the database.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.built = False
+        self.version = None
+        self.build_lock = threading.Lock()
+
+    def ensure_built(self):
+        version = catalogue_version()
+        if self.built and self.version == version:
+            return
+        with self.build_lock:
+            if self.built and self.version == version:
+                return
+            # Build aside and swap, so lookups keep answering meanwhile
+            fresh = PrefixIndex()
+            for pk, title in Song.objects.filter(is_active=True).values_list('id', 'title'):
+                fresh.add('song', pk, title, reverse('music:song_detail', args=[pk]))
+            for pk, name in Artist.objects.values_list('id', 'name'):
+                fresh.add('artist', pk, name, reverse('music:artist', args=[pk]))
+            for pk, title, artist_id in Album.objects.values_list('id', 'title', 'artist_id'):
+                fresh.add('album', pk, title, reverse('music:artist', args=[artist_id]))
+            with self.lock:
+                self.keys, self.entries = fresh.keys, fresh.entries
+            self.version = version
+            self.built = True
+
+    def lookup(self, prefix, limit=10):
+        self.ensure_built()
+        return super().lookup(prefix, limit)
+
+    def update_song(self, song):
+        if not self.built:
+            return
+        if song.is_active:
+            self.add('song', song.pk, song.title, reverse('music:song_detail', args=[song.pk]))
+        else:
+            self.remove('song', song.pk)
+
+    def update_artist(self, artist):
+        if self.built:
+            self.add('artist', artist.pk, artist.name, reverse('music:artist', args=[artist.pk]))
+
+    def update_album(self, album):
+        if self.built:
+            self.add('album', album.pk, album.title, reverse('music:artist', args=[album.artist_id]))
+
+    def discard(self, instance):
+        kind = {Song: 'song', Artist: 'artist', Album: 'album'}[type(instance)]
+        self.remove(kind, instance.pk)
+
+
+autocomplete_index = AutocompleteIndex()
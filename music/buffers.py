@@ -0,0 +1,202 @@
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .db import serialized_write
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Accumulates writes in process and flushes them in batches.
+
+    Subclasses define how an event is folded into the pending batch and how a
+    batch is written. A flush happens after `flush_interval` seconds on a
+    background timer, as soon as `max_pending` events are waiting, or at
+    interpreter exit. An interval of 0 writes every event straight through.
+    """
+
+    interval_setting = None
+    max_pending_setting = None
+    default_interval = 5
+    default_max_pending = 500
+    # Write batches through the process' single serialized writer
+    serialized = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = self.empty()
+        self.timer = None
+        atexit.register(self.flush_safely)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, self.interval_setting, self.default_interval)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, self.max_pending_setting, self.default_max_pending)
+
+    def empty(self):
+        raise NotImplementedError
+
+    def collect(self, pending, *args):
+        raise NotImplementedError
+
+    def merge(self, pending, batch):
+        """Fold a batch that failed to write back into `pending`"""
+        raise NotImplementedError
+
+    def size(self, pending):
+        return len(pending)
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def written(self, result):
+        """Follow-up to a committed write, given what write() returned"""
+
+    def add(self, *args):
+        with self.lock:
+            self.collect(self.pending, *args)
+            size = self.size(self.pending)
+        if self.flush_interval <= 0 or size >= self.max_pending:
+            self.flush()
+        else:
+            self.schedule()
+
+    def schedule(self):
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush_safely)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Write everything pending now; returns the number of events written"""
+        with self.lock:
+            batch, self.pending = self.pending, self.empty()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        size = self.size(batch)
+        if size:
+            try:
+                if self.serialized:
+                    result = serialized_write(self.write, batch)
+                else:
+                    result = self.write(batch)
+            except Exception:
+                # Keep the events for the next flush rather than losing them
+                with self.lock:
+                    self.merge(self.pending, batch)
+                self.schedule()
+                raise
+            # Outside the writer and the retry: the batch is committed, so a
+            # failing follow-up must neither rewrite nor requeue it
+            try:
+                self.written(result)
+            except Exception:
+                logger.exception('Following up a %s flush failed', type(self).__name__)
+        return size
+
+    def flush_safely(self):
+        """flush() for background callers (timer, exit), logging failures"""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing %s failed', type(self).__name__)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                # Timer threads get their own connections; don't leak them
+                connections.close_all()
+
+
+class PlayBuffer(WriteBehindBuffer):
+    """Buffers song plays and applies them as F() increments"""
+
+    interval_setting = 'PLAY_COUNT_FLUSH_INTERVAL'
+    max_pending_setting = 'PLAY_COUNT_MAX_PENDING'
+
+    def empty(self):
+        return {'songs': Counter(), 'interactions': Counter()}
+
+    def collect(self, pending, song_id, user_id=None):
+        pending['songs'][song_id] += 1
+        if user_id is not None:
+            pending['interactions'][(user_id, song_id)] += 1
+
+    def merge(self, pending, batch):
+        pending['songs'].update(batch['songs'])
+        pending['interactions'].update(batch['interactions'])
+
+    def size(self, pending):
+        return sum(pending['songs'].values())
+
+    def record(self, song_id, user_id=None):
+        """Count one play of `song_id`, attributed to `user_id` when given"""
+        self.add(song_id, user_id)
+
+    def write(self, batch):
+        from django.contrib.auth.models import User
+
+        from .models import Song, UserSongInteraction
+
+        # Group rows by increment so each distinct delta is one UPDATE
+        songs_by_delta = defaultdict(list)
+        for song_id, count in batch['songs'].items():
+            songs_by_delta[count].append(song_id)
+
+        # Songs or users deleted since their plays were buffered would fail
+        # the interaction rows' foreign keys and roll back the whole batch
+        interactions = batch['interactions']
+        if interactions:
+            song_ids = set(Song.objects.filter(pk__in=list(batch['songs'])).values_list('pk', flat=True))
+            user_ids = set(User.objects.filter(pk__in={user_id for user_id, _ in interactions})
+                           .values_list('pk', flat=True))
+            interactions = {
+                (user_id, song_id): count for (user_id, song_id), count in interactions.items()
+                if song_id in song_ids and user_id in user_ids
+            }
+
+        interactions_by_delta = defaultdict(list)
+        for (user_id, song_id), count in interactions.items():
+            interactions_by_delta[(count, user_id)].append(song_id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            for count, song_ids in songs_by_delta.items():
+                Song.objects.filter(pk__in=song_ids).update(
+                    plays_count=F('plays_count') + count
+                )
+
+            if interactions:
+                UserSongInteraction.objects.bulk_create(
+                    [
+                        UserSongInteraction(user_id=user_id, song_id=song_id)
+                        for user_id, song_id in interactions
+                    ],
+                    ignore_conflicts=True,
+                )
+            for (count, user_id), song_ids in interactions_by_delta.items():
+                UserSongInteraction.objects.filter(
+                    user_id=user_id, song_id__in=song_ids
+                ).update(play_count=F('play_count') + count, played_at=now)
+        return {song_id for _, song_id in interactions}
+
+    def written(self, song_ids):
+        from .similarity import similarity_updates
+
+        if song_ids:
+            # Co-listening changed, so these songs' neighbours are stale
+            similarity_updates.mark(*song_ids)
+
+
+play_buffer = PlayBuffer()
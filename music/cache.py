@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+CATALOGUE_VERSION_KEY = 'music:catalogue-version'
+
+
+def catalogue_version():
+    """
+    Current catalogue version, part of every catalogue cache key.
+
+    Bumping it (on Song/Artist/Album/Genre changes) orphans all cached blocks and
+    fragments at once; they then age out of the cache on their own.
+    """
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 1, timeout=None)
+
+
+def cache_timeout():
+    return getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+
+
+def cached_block(name, compute, version=None):
+    """Result of `compute()` cached under `name` for the current catalogue version"""
+    if version is None:
+        version = catalogue_version()
+    key = f'music:block:{name}:{version}'
+    return cache.get_or_set(key, compute, timeout=cache_timeout())
+
+
+def lazy_block(name, compute, version=None):
+    """
+    Like cached_block(), but only evaluated when first used.
+
+    Templates that wrap the block in a cached fragment never touch it on a
+    fragment hit, so neither the cache nor the database is consulted.
+    """
+    return SimpleLazyObject(lambda: cached_block(name, compute, version))
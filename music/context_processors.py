@@ -1,10 +1,16 @@
-from .models import RecentPlay
+from django.utils.functional import SimpleLazyObject
+
+from .history import now_playing_for
 
 def now_playing(request):
-    """Context processor for currently playing song"""
-    if request.user.is_authenticated:
-        recent = RecentPlay.objects.filter(user=request.user).first()
-        return {
-            'now_playing': recent.song if recent else None
-        }
-    return {}
\ No newline at end of file
+    """
+    Context processor for the user's last played song.
+
+    Lazy, so pages that never mention `now_playing` pay nothing, and served
+    from a per-user cache entry that the next play invalidates.
+    """
+    def load():
+        if not request.user.is_authenticated:
+            return None
+        return now_playing_for(request.user.pk)
+    return {'now_playing': SimpleLazyObject(load)}
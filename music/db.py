@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+# Per-connection settings. WAL (readers no longer block the writer, nor it
+# them) isn't among them: it is stored in the database file, so a deploy
+# switches it on once with `manage.py enable_wal` (see enable_wal below)
+DEFAULT_SQLITE_PRAGMAS = {
+    'synchronous': 'normal',  # safe with WAL; fsyncs at checkpoints only
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,  # ms to wait for another connection's write lock
+}
+
+# One writer at a time in this process: with several threads each taking
+# SQLite's write lock, the losers fail at once with "database is locked"
+# whenever they read before writing, whatever the busy timeout
+_write_lock = threading.RLock()
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+
+
+def configure_connection(connection):
+    """Apply SQLITE_PRAGMAS to a newly opened SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def enable_wal(using=DEFAULT_DB_ALIAS):
+    """Switch an SQLite database to WAL mode for good; returns the journal mode now in use"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode = wal')
+        return cursor.fetchone()[0]
+
+
+def is_locked(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def write_retries():
+    return getattr(settings, 'SQLITE_WRITE_RETRIES', 5)
+
+
+def serialized_write(fn, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Run the write `fn(*args, **kwargs)` while no other thread of this process
+    is writing, retrying with backoff when another process holds the lock.
+
+    `fn` must be its own transaction: it's only retried when it isn't nested
+    in an outer atomic block, where a partial retry would be wrong.
+    """
+    retries = 0 if connections[using].in_atomic_block else write_retries()
+    with _write_lock:
+        for attempt in range(retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or not is_locked(error):
+                    raise
+                delay = 0.05 * 2 ** attempt
+                logger.warning('Database locked running %s; retrying in %.2fs', fn.__name__, delay)
+                time.sleep(delay)
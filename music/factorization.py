@@ -0,0 +1,52 @@
+"""
+Matrix factorization helpers for the recommendation batch job.
+
+This module deliberately has no Django imports so that process-pool workers
+can import it cheaply, whatever the multiprocessing start method.
+"""
+import numpy as np
+from scipy.sparse.linalg import svds
+
+# Item factors shared by every task of a worker process
+_item_factors = None
+
+
+def factorize(matrix, factors=32):
+    """
+    Truncated SVD of a sparse user x item confidence matrix.
+
+    Returns (user_factors, item_factors) such that their product
+    approximates `matrix`; singular values are folded into the user side.
+    """
+    k = min(factors, min(matrix.shape) - 1)
+    if k < 1:
+        return np.zeros((matrix.shape[0], 0)), np.zeros((matrix.shape[1], 0))
+    u, s, vt = svds(matrix.astype(np.float64), k=k)
+    return u * s, vt.T
+
+
+def init_worker(item_factors):
+    global _item_factors
+    _item_factors = item_factors
+
+
+def top_k(user_rows, seen, k):
+    """
+    Best `k` unseen items for a chunk of users.
+
+    `user_rows` is a (chunk, factors) array and `seen` a list of arrays of
+    item indices each user already interacted with. Returns a list of
+    (item_indices, scores) pairs, best first; only positive scores count.
+    """
+    scores = user_rows @ _item_factors.T
+    results = []
+    for row, exclude in zip(scores, seen):
+        row[exclude] = -np.inf
+        count = min(k, int((row > 0).sum()))
+        if count == 0:
+            results.append((np.empty(0, dtype=np.int64), np.empty(0)))
+            continue
+        best = np.argpartition(-row, count - 1)[:count]
+        best = best[np.argsort(-row[best], kind='stable')]
+        results.append((best, row[best]))
+    return results
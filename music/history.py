@@ -0,0 +1,141 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .buffers import WriteBehindBuffer
+from .cache import cache_timeout, catalogue_version
+from .models import RecentPlay, Song
+
+
+def history_length():
+    return getattr(settings, 'RECENT_PLAYS_PER_USER', 50)
+
+
+def history_cache_key(user_id):
+    return f'music:recent-plays:{user_id}'
+
+
+def now_playing_cache_key(user_id):
+    return f'music:now-playing:{user_id}'
+
+
+def latest_per_song(plays):
+    """(song_id, played_at) pairs, newest first, keeping each song's latest play"""
+    seen = set()
+    latest = []
+    for song_id, played_at in plays:
+        if song_id not in seen:
+            seen.add(song_id)
+            latest.append((song_id, played_at))
+    return latest
+
+
+class RecentPlayBuffer(WriteBehindBuffer):
+    """
+    Buffers listening history and writes it with one bulk_create per flush.
+
+    Each user keeps only their last RECENT_PLAYS_PER_USER plays; older rows
+    are trimmed as part of the flush. Every play is a row with its real
+    time, so replays show up in the history.
+    """
+
+    interval_setting = 'RECENT_PLAYS_FLUSH_INTERVAL'
+    max_pending_setting = 'RECENT_PLAYS_MAX_PENDING'
+
+    def empty(self):
+        return []
+
+    def collect(self, pending, user_id, song_id, played_at):
+        pending.append((user_id, song_id, played_at))
+
+    def merge(self, pending, batch):
+        pending[:0] = batch
+
+    def record(self, user_id, song_id):
+        played_at = timezone.now()
+        self.add(user_id, song_id, played_at)
+        # Put the play in the cached history so reads see it before the flush
+        plays = latest_per_song([(song_id, played_at), *recent_history(user_id)])
+        cache.set(history_cache_key(user_id), plays[:history_length()], cache_timeout())
+        cache.delete(now_playing_cache_key(user_id))
+
+    def write(self, batch):
+        limit = history_length()
+        # Skip plays of songs or by users deleted since they were buffered
+        song_ids = set(Song.objects.filter(pk__in={song_id for _, song_id, _ in batch}).values_list('pk', flat=True))
+        user_ids = set(User.objects.filter(pk__in={user_id for user_id, _, _ in batch}).values_list('pk', flat=True))
+        by_user = defaultdict(list)
+        for user_id, song_id, played_at in batch:
+            if song_id in song_ids and user_id in user_ids:
+                by_user[user_id].append(RecentPlay(user_id=user_id, song_id=song_id, played_at=played_at))
+
+        with transaction.atomic():
+            for user_id, plays in by_user.items():
+                RecentPlay.objects.bulk_create(plays[-limit:])
+                self.trim(user_id, limit)
+        cache.delete_many([history_cache_key(user_id) for user_id in by_user])
+
+    def trim(self, user_id, limit):
+        """Delete everything older than the user's `limit`-th newest play"""
+        history = RecentPlay.objects.filter(user_id=user_id)
+        oldest_kept = history.order_by('-played_at', '-id').values_list('played_at', 'id')[limit - 1:limit]
+        for played_at, pk in oldest_kept:
+            history.filter(Q(played_at__lt=played_at) | Q(played_at=played_at, id__lt=pk)).delete()
+
+
+recent_plays = RecentPlayBuffer()
+
+
+def recent_history(user_id):
+    """Cached (song_id, played_at) pairs of a user's recent songs, newest first"""
+    key = history_cache_key(user_id)
+    plays = cache.get(key)
+    if plays is None:
+        plays = latest_per_song(
+            RecentPlay.objects.filter(user_id=user_id)
+            .order_by('-played_at', '-id')
+            .values_list('song_id', 'played_at')[:history_length()]
+        )
+        cache.set(key, plays, cache_timeout())
+    return plays
+
+
+def recent_plays_for(user, limit=10):
+    """
+    A user's most recently played songs as unsaved RecentPlay objects
+    (`.song`, `.played_at`), one per song, loaded with a single query.
+    """
+    if not user.is_authenticated:
+        return []
+    plays = recent_history(user.pk)[:limit]
+    songs = Song.objects.filter(is_active=True).for_listing().in_bulk([song_id for song_id, _ in plays])
+    return [
+        RecentPlay(user=user, song=songs[song_id], played_at=played_at)
+        for song_id, played_at in plays if song_id in songs
+    ]
+
+
+def now_playing_for(user_id):
+    """
+    The song a user played last, with its artist and album, or None.
+
+    Cached per user until their next play; the catalogue version is stored
+    alongside so edits to the song show up too.
+    """
+    key = now_playing_cache_key(user_id)
+    version = catalogue_version()
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    song = None
+    plays = recent_history(user_id)
+    if plays:
+        song = Song.objects.filter(pk=plays[0][0], is_active=True).for_listing().first()
+    cache.set(key, (version, song), cache_timeout())
+    return song
@@ -0,0 +1,53 @@
+import logging
+
+from .models import Album, Playlist, Song
+from .tasks import submit
+from .transcode import enqueue_renditions
+from .waveform import enqueue_waveform
+from .utils import MetadataError, extract_metadata, file_hash
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_song(song_id):
+    """
+    Read tags, true duration and a content hash from a song's audio file and
+    write them back. Fields the uploader filled in are left alone.
+    """
+    song = Song.objects.select_related('artist').get(pk=song_id)
+    try:
+        with song.audio_file.open('rb') as audio:
+            metadata = extract_metadata(audio)
+            audio.seek(0)
+            content_hash = file_hash(audio)
+    except (MetadataError, OSError) as e:
+        logger.warning('Could not ingest song %s: %s', song_id, e)
+        Song.objects.filter(pk=song_id).update(ingest_status='failed')
+        return None
+
+    song.duration_seconds = round(metadata['length'])
+    song.content_hash = content_hash
+    song.ingest_status = 'ready'
+    fields = ['duration_seconds', 'content_hash', 'ingest_status', 'updated_at']
+    if not song.title and metadata['title']:
+        song.title = metadata['title']
+        fields.append('title')
+    if song.album_id is None and metadata['album']:
+        song.album, _ = Album.objects.get_or_create(title=metadata['album'], artist=song.artist)
+        fields.append('album')
+
+    # Only these columns are written; post_save reindexes the song for search
+    # and autocomplete and bumps the catalogue cache version
+    song.save(update_fields=fields)
+    # Playlist totals aren't kept by signals on Song, so refresh them here
+    for playlist in Playlist.objects.filter(songs=song_id).distinct():
+        playlist.refresh_stats()
+    enqueue_renditions(song_id)
+    enqueue_waveform(song_id)
+    return metadata
+
+
+def enqueue_ingest(song):
+    """Schedule ingestion of a freshly uploaded song on the worker pool"""
+    Song.objects.filter(pk=song.pk).update(ingest_status='pending')
+    submit(ingest_song, song.pk)
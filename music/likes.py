@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import F
+
+from .db import serialized_write
+from .models import Song, UserSongInteraction
+from .similarity import similarity_updates
+
+
+def apply_likes(user, actions):
+    """
+    Apply like/unlike actions for `user` in one transaction.
+
+    `actions` maps song ids to the desired liked state. Only interactions whose
+    `is_liked` actually flips touch `Song.likes_count`, so repeating an action
+    (double clicks, replayed offline queues) is a no-op. Returns a dict of
+    song id -> {'likes_count', 'is_liked'} for the songs that exist.
+    """
+    song_ids = list(Song.objects.filter(pk__in=actions).values_list('id', flat=True))
+    if not song_ids:
+        return {}
+
+    flipped = serialized_write(_flip_likes, user, actions, song_ids)
+    if flipped:
+        # Outside the writer, and after an outer transaction commits; a
+        # failing similarity flush is logged, it can't undo the likes
+        transaction.on_commit(lambda: similarity_updates.mark(*flipped), robust=True)
+
+    counts = dict(Song.objects.filter(pk__in=song_ids).values_list('id', 'likes_count'))
+    return {
+        song_id: {'likes_count': counts[song_id], 'is_liked': actions[song_id]}
+        for song_id in song_ids
+    }
+
+
+@transaction.atomic
+def _flip_likes(user, actions, song_ids):
+    UserSongInteraction.objects.bulk_create(
+        [UserSongInteraction(user=user, song_id=song_id) for song_id in song_ids],
+        ignore_conflicts=True,
+    )
+    flipped = []
+    for liked, delta in ((True, 1), (False, -1)):
+        wanted = [song_id for song_id in song_ids if actions[song_id] == liked]
+        if not wanted:
+            continue
+        flipping = list(
+            UserSongInteraction.objects.select_for_update()
+            .filter(user=user, song_id__in=wanted, is_liked=not liked)
+            .values_list('song_id', flat=True)
+        )
+        if not flipping:
+            continue
+        UserSongInteraction.objects.filter(user=user, song_id__in=flipping).update(
+            is_liked=liked
+        )
+        Song.objects.filter(pk__in=flipping).update(likes_count=F('likes_count') + delta)
+        flipped += flipping
+    return flipped
+
+
+def parse_action(action):
+    """Map a 'like'/'unlike' action to a liked state"""
+    if action == 'like':
+        return True
+    if action == 'unlike':
+        return False
+    raise ValueError(f'Unknown action: {action!r}')
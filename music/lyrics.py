@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .db import serialized_write
+from .models import CachedLyrics, Song
+
+logger = logging.getLogger(__name__)
+
+KEY_LENGTH = 255
+
+
+class LyricsUnavailable(Exception):
+    """The provider couldn't be asked: timeout, server error or open breaker"""
+
+
+def lyrics_setting(name, default):
+    return getattr(settings, f'LYRICS_{name}', default)
+
+
+def lyrics_key(text):
+    """Normalized (case, whitespace) cache key part"""
+    return ' '.join(text.split()).casefold()[:KEY_LENGTH]
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service. After `threshold` consecutive failures
+    the breaker opens and calls fail fast; `reset_after` seconds later one
+    trial call is let through, and its outcome closes or reopens it.
+    """
+
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_after
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+class LyricsProvider:
+    """
+    Client of a lyrics.ovh-style API (GET <url>/<artist>/<title> answering
+    {"lyrics": ...}, 404 when unknown). One pooled session serves every
+    thread; each request has connect/read timeouts and goes through the
+    circuit breaker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = None
+        self.breaker = CircuitBreaker(
+            lyrics_setting('BREAKER_FAILURES', 5), lyrics_setting('BREAKER_RESET', 60)
+        )
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                session = requests.Session()
+                pool_size = lyrics_setting('POOL_SIZE', 10)
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.headers['Accept'] = 'application/json'
+                self.session = session
+            return self.session
+
+    def fetch(self, artist, title):
+        """The lyrics, or None when the provider has none; raises LyricsUnavailable"""
+        if not self.breaker.allow():
+            raise LyricsUnavailable('Lyrics provider disabled after repeated failures')
+
+        base = lyrics_setting('API_URL', 'https://api.lyrics.ovh/v1').rstrip('/')
+        url = '/'.join([base, *(quote(' '.join(part.split()), safe='') for part in (artist, title))])
+        try:
+            response = self.get_session().get(url, timeout=lyrics_setting('TIMEOUT', (3.05, 10)))
+            if response.status_code == 404:
+                lyrics = None
+            else:
+                response.raise_for_status()
+                body = response.json()
+                if not isinstance(body, dict) or not isinstance(body.get('lyrics') or '', str):
+                    raise ValueError(f'unexpected response body {response.text[:100]!r}')
+                lyrics = body.get('lyrics') or None
+        except (requests.RequestException, ValueError) as e:
+            self.breaker.failure()
+            raise LyricsUnavailable(f'Fetching lyrics for {artist!r} - {title!r} failed: {e}') from e
+        except BaseException:
+            # Anything else still ends the call, or a half-open trial would never finish
+            self.breaker.failure()
+            raise
+
+        self.breaker.success()
+        return lyrics.strip() if lyrics else None
+
+
+lyrics_provider = LyricsProvider()
+
+
+def cached_lyrics(artist, title):
+    """
+    (True, lyrics or None) when the cache answers for this song, (False, None)
+    when the provider must be asked. "No lyrics" answers expire after
+    LYRICS_NEGATIVE_TTL seconds, found lyrics never do.
+    """
+    entry = CachedLyrics.objects.filter(artist_key=lyrics_key(artist), title_key=lyrics_key(title)).first()
+    if entry is None:
+        return False, None
+    if entry.lyrics:
+        return True, entry.lyrics
+    expires = entry.fetched_at + timedelta(seconds=lyrics_setting('NEGATIVE_TTL', 7 * 86400))
+    return expires > timezone.now(), None
+
+
+def store_lyrics(artist, title, lyrics):
+    serialized_write(
+        CachedLyrics.objects.update_or_create,
+        artist_key=lyrics_key(artist), title_key=lyrics_key(title),
+        defaults={'lyrics': lyrics or '', 'fetched_at': timezone.now()},
+    )
+
+
+def get_lyrics(artist, title, provider=None):
+    """
+    Lyrics for a song from the cache or the provider, or None when there are
+    none or the provider can't be reached (that outcome isn't cached).
+    """
+    hit, lyrics = cached_lyrics(artist, title)
+    if hit:
+        return lyrics
+    try:
+        lyrics = (provider or lyrics_provider).fetch(artist, title)
+    except LyricsUnavailable as e:
+        logger.warning('%s', e)
+        return None
+    store_lyrics(artist, title, lyrics)
+    return lyrics
+
+
+def save_song_lyrics(song_id, lyrics):
+    """Give a song fetched lyrics, unless it got some in the meantime"""
+    return serialized_write(
+        Song.objects.filter(pk=song_id, lyrics='').update, lyrics=lyrics, lyrics_source='api'
+    )
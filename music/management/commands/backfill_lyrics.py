@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from music.lyrics import LyricsUnavailable, cached_lyrics, lyrics_provider, save_song_lyrics, store_lyrics
+from music.models import Song
+
+
+class Command(BaseCommand):
+    help = (
+        'Fetch lyrics for every active song that has none. Cached answers are '
+        'used first; at most --workers requests to the provider are in flight.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'LYRICS_BACKFILL_WORKERS', 4))
+        parser.add_argument('--limit', type=int, help='Only look at this many songs')
+
+    def handle(self, *args, **options):
+        songs = (
+            Song.objects.filter(is_active=True, lyrics='')
+            .order_by('pk').values_list('pk', 'artist__name', 'title')
+        )
+        if options['limit']:
+            songs = songs[:options['limit']]
+        songs = songs.iterator()
+
+        self.counts = {'filled': 0, 'none': 0, 'failed': 0}
+        workers = max(1, options['workers'])
+        # Only HTTP runs on the pool; cache lookups and saves stay on this
+        # thread, so the workers never compete for the database
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lyrics') as executor:
+            while batch := list(islice(songs, workers * 4)):
+                futures = {}
+                for song_id, artist, title in batch:
+                    hit, lyrics = cached_lyrics(artist, title)
+                    if hit:
+                        self.apply(song_id, lyrics)
+                    else:
+                        futures[executor.submit(lyrics_provider.fetch, artist, title)] = (song_id, artist, title)
+
+                for future in as_completed(futures):
+                    song_id, artist, title = futures[future]
+                    try:
+                        lyrics = future.result()
+                    except LyricsUnavailable as e:
+                        self.counts['failed'] += 1
+                        self.stderr.write(str(e))
+                        continue
+                    store_lyrics(artist, title, lyrics)
+                    self.apply(song_id, lyrics)
+
+                if lyrics_provider.breaker.is_open:
+                    self.stderr.write('Lyrics provider keeps failing; stopping early')
+                    break
+
+        self.stdout.write(self.style.SUCCESS(
+            'Filled {filled} songs, {none} without lyrics, {failed} failed'.format(**self.counts)
+        ))
+
+    def apply(self, song_id, lyrics):
+        if lyrics and save_song_lyrics(song_id, lyrics):
+            self.counts['filled'] += 1
+        elif not lyrics:
+            self.counts['none'] += 1
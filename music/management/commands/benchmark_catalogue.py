@@ -0,0 +1,185 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from music.models import Album, Artist, Playlist, PlaylistSong, RecentPlay, Song
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large synthetic catalogue and report query plans and timings of '
+        'the main listings with and without the catalogue indexes. Everything '
+        'runs in one transaction that is rolled back, so the database is left '
+        'as it was (needs transactional DDL, e.g. SQLite or PostgreSQL).'
+    )
+
+    # The indexes under test, declared in the models' Meta.indexes
+    models = [Song, PlaylistSong, RecentPlay]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--songs', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--playlist-size', type=int, default=5000)
+        parser.add_argument('--runs', type=int, default=20,
+                            help='Timed executions per query; the median is reported')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-plans', action='store_true', help='Only print timings')
+
+    def handle(self, *args, **options):
+        self.options = options
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self.stdout.write('Seeding...')
+                fixtures = self.seed()
+                queries = self.queries(**fixtures)
+
+                after = self.measure(queries, 'with indexes')
+                self.drop_indexes()
+                before = self.measure(queries, 'without indexes')
+                self.report(queries, before, after)
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS('Done; synthetic data and index changes rolled back'))
+
+    def seed(self):
+        count = self.options['songs']
+        artists = Artist.objects.bulk_create(
+            [Artist(name=f'Bench artist {i}') for i in range(max(1, count // 10))], batch_size=1000
+        )
+        albums = Album.objects.bulk_create(
+            [Album(title=f'Bench album {i}', artist=artists[i % len(artists)])
+             for i in range(max(1, count // 8))],
+            batch_size=1000,
+        )
+        songs = Song.objects.bulk_create(
+            [
+                Song(
+                    title=f'Bench song {i}',
+                    artist=artists[i % len(artists)],
+                    album=albums[i % len(albums)],
+                    audio_file=f'bench/{i}.mp3',
+                    plays_count=int(random.paretovariate(1.2)),
+                    duration_seconds=random.randint(90, 420),
+                    is_active=random.random() > 0.05,
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+        # uploaded_at is auto_now_add, so spread it out afterwards
+        now = timezone.now()
+        for song in songs:
+            song.uploaded_at = now - timedelta(minutes=random.randint(0, 525600))
+        Song.objects.bulk_update(songs, ['uploaded_at'], batch_size=1000)
+
+        users = User.objects.bulk_create(
+            [User(username=f'bench-user-{i}-{random.random()}') for i in range(self.options['users'])]
+        )
+        RecentPlay.objects.bulk_create(
+            [
+                RecentPlay(user=user, song=random.choice(songs),
+                           played_at=now - timedelta(minutes=random.randint(0, 100000)))
+                for user in users for _ in range(50)
+            ],
+            batch_size=1000,
+        )
+
+        playlist = Playlist.objects.create(name='Bench playlist', user=users[0])
+        PlaylistSong.objects.bulk_create(
+            [
+                PlaylistSong(playlist=playlist, song=song, order=(i + 1) * 1024)
+                for i, song in enumerate(random.sample(songs, min(self.options['playlist_size'], len(songs))))
+            ],
+            batch_size=1000,
+        )
+        # Padding playlists so the playlist index has something to skip over
+        for user in users[1:20]:
+            other = Playlist.objects.create(name='Bench padding', user=user)
+            PlaylistSong.objects.bulk_create(
+                [PlaylistSong(playlist=other, song=song, order=(i + 1) * 1024)
+                 for i, song in enumerate(random.sample(songs, min(500, len(songs))))]
+            )
+
+        with connection.cursor() as cursor:
+            # Fresh planner statistics, as a long-lived database would have
+            cursor.execute('ANALYZE')
+        return {'artist': artists[0], 'user': users[-1], 'playlist': playlist}
+
+    def queries(self, artist, user, playlist):
+        """The listing queries of the main views, as the views build them"""
+        active = Song.objects.filter(is_active=True)
+        return {
+            'home: recent songs': active.for_listing().order_by('-uploaded_at')[:10],
+            'home: popular songs': active.for_listing().order_by('-plays_count')[:10],
+            'api: popular page': active.for_listing().order_by('-plays_count', '-id')[:21],
+            'artist page': Song.objects.filter(artist=artist, is_active=True)
+                                       .select_related('album').order_by('-plays_count', '-id')[:20],
+            'recent plays / now_playing': RecentPlay.objects.filter(user=user)
+                                                            .order_by('-played_at', '-id')[:50],
+            'playlist detail': playlist.ordered_songs(),
+        }
+
+    def measure(self, queries, phase):
+        """
+        Median database time and plan of each query. The SQL is tagged with
+        the phase: SQLite's statement cache would otherwise keep running the
+        plans it prepared before the indexes were dropped.
+        """
+        results = {}
+        with connection.cursor() as cursor:
+            for label, queryset in queries.items():
+                sql, params = queryset.query.sql_with_params()
+                sql = f'{sql} /* {phase} */'
+                cursor.execute(sql, params)  # warm up
+                cursor.fetchall()
+                timings = []
+                for _ in range(self.options['runs']):
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+                results[label] = (statistics.median(timings), plan)
+        return results
+
+    def drop_indexes(self):
+        schema_editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model in self.models:
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.remove_sql(model, schema_editor)))
+
+    def report(self, queries, before, after):
+        self.stdout.write('')
+        self.stdout.write(f'{"query":<30} {"without":>10} {"with":>10} {"speedup":>8}')
+        for label in queries:
+            without, with_ = before[label][0], after[label][0]
+            self.stdout.write(
+                f'{label:<30} {without:>8.2f}ms {with_:>8.2f}ms {without / max(with_, 1e-6):>7.1f}x'
+            )
+        if self.options['no_plans']:
+            return
+        for label in queries:
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write('  without indexes:')
+            self.stdout.write(self.indent(before[label][1]))
+            self.stdout.write('  with indexes:')
+            self.stdout.write(self.indent(after[label][1]))
+
+    def indent(self, plan):
+        return '\n'.join(f'    {line}' for line in plan.splitlines())
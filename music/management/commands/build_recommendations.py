@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from music.recommendations import TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Factorize the user x song interaction matrix and store top-K recommendations per user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=32,
+                            help='Number of latent factors')
+        parser.add_argument('--top-k', type=int, default=TOP_K,
+                            help='Recommendations stored per user')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Scoring processes (default: one per CPU)')
+
+    def handle(self, *args, **options):
+        users = build_recommendations(
+            factors=options['factors'],
+            top_k=options['top_k'],
+            workers=options['workers'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Stored recommendations for {users} users'))
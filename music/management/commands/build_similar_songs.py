@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from music.similarity import rebuild_similar_songs
+
+
+class Command(BaseCommand):
+    help = 'Precompute the nearest-neighbour list of every song (or of the given songs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('song_ids', nargs='*', type=int,
+                            help='Only recompute these songs')
+
+    def handle(self, *args, **options):
+        count = rebuild_similar_songs(options['song_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Updated neighbours for {count} songs'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from music.models import Song
+from music.waveform import build_waveform
+
+
+class Command(BaseCommand):
+    help = 'Compute the waveform peaks of every song (or of the given songs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('song_ids', nargs='*', type=int,
+                            help='Only compute these songs')
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute waveforms that already exist')
+
+    def handle(self, *args, **options):
+        songs = Song.objects.exclude(audio_file='')
+        if options['song_ids']:
+            songs = songs.filter(pk__in=options['song_ids'])
+        elif not options['force']:
+            songs = songs.filter(waveform='')
+
+        built = 0
+        for song_id in songs.values_list('pk', flat=True).iterator():
+            if build_waveform(song_id, force=options['force']) is not None:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f'Computed {built} waveforms'))
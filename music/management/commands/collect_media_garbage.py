@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from music.storage import collect_garbage
+from music.thumbnails import collect_thumbnail_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete stored files and thumbnails that no song, album, artist or rendition references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the files that would be deleted')
+
+    def handle(self, *args, **options):
+        orphans = collect_garbage(dry_run=options['dry_run'])
+        orphans += collect_thumbnail_garbage(dry_run=options['dry_run'])
+        for name in orphans:
+            self.stdout.write(name)
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(orphans)} unreferenced files'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from music.db import enable_wal
+
+
+class Command(BaseCommand):
+    help = (
+        'Switch the SQLite database to WAL journal mode, so reads and the writer '
+        'stop blocking each other. The mode is stored in the database file; run '
+        'this once per deployment, not on every connection.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to switch (default: "default")')
+
+    def handle(self, *args, **options):
+        mode = enable_wal(options['database'])
+        if mode is None:
+            self.stdout.write('Not an SQLite database; nothing to do')
+        elif mode != 'wal':
+            raise CommandError(f'SQLite kept the {mode} journal mode')
+        else:
+            self.stdout.write(self.style.SUCCESS('Journal mode is WAL'))
@@ -0,0 +1,156 @@
+import os
+from multiprocessing import Pool
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music.cache import bump_catalogue_version
+from music.models import Album, Artist, Genre, Song, song_upload_path
+from music.search import get_search_backend
+from music.utils import AUDIO_EXTENSIONS, scan_audio_file
+
+UNKNOWN_ARTIST = 'Unknown Artist'
+
+
+class Command(BaseCommand):
+    help = 'Import every audio file under a directory, reading tags in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Tag scanning processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Songs inserted per transaction')
+        parser.add_argument('--copy', action='store_true',
+                            help='Copy files into MEDIA_ROOT instead of requiring them to live there')
+        parser.add_argument('--user', help='Username recorded as the uploader')
+
+    def handle(self, *args, **options):
+        root = Path(options['directory']).resolve()
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        if not root.is_dir():
+            raise CommandError(f'{root} is not a directory')
+        if not options['copy'] and media_root not in (root, *root.parents):
+            raise CommandError(f'{root} is outside MEDIA_ROOT; pass --copy to copy files in')
+
+        self.media_root = media_root
+        self.copy = options['copy']
+        self.uploader = None
+        if options['user']:
+            self.uploader = User.objects.get(username=options['user'])
+
+        # Everything already imported, so interrupted runs can simply be resumed
+        self.known_names = set(Song.objects.values_list('audio_file', flat=True))
+        self.known_hashes = set(Song.objects.exclude(content_hash='').values_list('content_hash', flat=True))
+        self.artists = dict(Artist.objects.order_by('-id').values_list('name', 'id'))
+        self.albums = {(artist_id, title): pk for pk, artist_id, title in
+                       Album.objects.order_by('-id').values_list('id', 'artist_id', 'title')}
+        self.genres = dict(Genre.objects.order_by('-id').values_list('name', 'id'))
+
+        paths = [path for path in self.walk(root) if self.storage_name(path) not in self.known_names]
+        self.stdout.write(f'Scanning {len(paths)} new files')
+
+        imported = skipped = failed = 0
+        batch = []
+        with Pool(options['workers']) as pool:
+            for result in pool.imap_unordered(scan_audio_file, paths, chunksize=64):
+                if 'error' in result:
+                    failed += 1
+                    self.stderr.write(f"{result['path']}: {result['error']}")
+                elif result['content_hash'] in self.known_hashes:
+                    skipped += 1
+                else:
+                    self.known_hashes.add(result['content_hash'])
+                    batch.append(result)
+                if len(batch) >= options['batch_size']:
+                    imported += self.insert(batch)
+                    batch = []
+                    self.stdout.write(f'  {imported} imported')
+        if batch:
+            imported += self.insert(batch)
+
+        if imported:
+            # bulk_create skips model signals, so refresh derived state once
+            get_search_backend().rebuild()
+            bump_catalogue_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} songs ({skipped} duplicates, {failed} unreadable)'
+        ))
+
+    def walk(self, root):
+        for directory, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in AUDIO_EXTENSIONS:
+                    yield os.path.join(directory, filename)
+
+    def storage_name(self, path):
+        """Name the file is (or would be) stored under, relative to MEDIA_ROOT"""
+        try:
+            return Path(path).resolve().relative_to(self.media_root).as_posix()
+        except ValueError:
+            return None
+
+    def insert(self, batch):
+        """Insert one batch of scanned files, creating artists/albums/genres as needed"""
+        with transaction.atomic():
+            self.create_missing(
+                Artist, self.artists,
+                {result['artist'] or UNKNOWN_ARTIST for result in batch},
+                lambda name: Artist(name=name), lambda artist: artist.name,
+            )
+            self.create_missing(
+                Album, self.albums,
+                {(self.artists[result['artist'] or UNKNOWN_ARTIST], result['album'])
+                 for result in batch if result['album']},
+                lambda key: Album(artist_id=key[0], title=key[1]),
+                lambda album: (album.artist_id, album.title),
+            )
+            self.create_missing(
+                Genre, self.genres,
+                {result['genre'] for result in batch if result['genre']},
+                lambda name: Genre(name=name), lambda genre: genre.name,
+            )
+
+            songs = []
+            for result in batch:
+                artist_name = result['artist'] or UNKNOWN_ARTIST
+                artist_id = self.artists[artist_name]
+                song = Song(
+                    title=result['title'] or Path(result['path']).stem,
+                    artist=Artist(pk=artist_id, name=artist_name),
+                    album_id=self.albums.get((artist_id, result['album'])),
+                    duration_seconds=round(result['length']),
+                    content_hash=result['content_hash'],
+                    uploaded_by=self.uploader,
+                )
+                song.audio_file.name = self.store(song, result['path'])
+                songs.append(song)
+            Song.objects.bulk_create(songs, batch_size=500)
+
+            Song.genre.through.objects.bulk_create(
+                [
+                    Song.genre.through(song_id=song.pk, genre_id=self.genres[result['genre']])
+                    for song, result in zip(songs, batch) if result['genre']
+                ],
+                batch_size=500,
+            )
+        return len(songs)
+
+    def create_missing(self, model, known, keys, build, key_of):
+        """bulk_create the rows for `keys` not yet in `known`, then record their ids"""
+        missing = [build(key) for key in keys if key not in known]
+        for obj in model.objects.bulk_create(missing, batch_size=500):
+            known[key_of(obj)] = obj.pk
+
+    def store(self, song, path):
+        name = self.storage_name(path)
+        if name is not None:
+            return name
+        # Outside MEDIA_ROOT (--copy): store it where an upload would go
+        with open(path, 'rb') as audio:
+            return song.audio_file.storage.save(song_upload_path(song, os.path.basename(path)), File(audio))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from music.models import Song
+from music.transcode import build_renditions, ffmpeg_binary
+
+
+class Command(BaseCommand):
+    help = 'Build the lower-bitrate renditions of every song (or of the given songs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('song_ids', nargs='*', type=int,
+                            help='Only transcode these songs')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-encode renditions that already exist')
+
+    def handle(self, *args, **options):
+        if not ffmpeg_binary():
+            raise CommandError('ffmpeg was not found; install it or set FFMPEG_BINARY')
+
+        songs = Song.objects.exclude(audio_file='')
+        if options['song_ids']:
+            songs = songs.filter(pk__in=options['song_ids'])
+
+        total = 0
+        for song_id in songs.values_list('pk', flat=True).iterator():
+            total += build_renditions(song_id, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Built {total} renditions'))
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS music_search_index USING fts5("
+        "title, artist, album, lyrics, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    # rowid = pk * 4 + kind (1 song, 2 artist, 3 album)
+    schema_editor.execute(
+        "INSERT INTO music_search_index (rowid, title, artist, album, lyrics) "
+        "SELECT id * 4 + 2, name, '', '', '' FROM music_artist"
+    )
+    schema_editor.execute(
+        "INSERT INTO music_search_index (rowid, title, artist, album, lyrics) "
+        "SELECT al.id * 4 + 3, al.title, a.name, '', '' "
+        "FROM music_album al JOIN music_artist a ON a.id = al.artist_id"
+    )
+    schema_editor.execute(
+        "INSERT INTO music_search_index (rowid, title, artist, album, lyrics) "
+        "SELECT s.id * 4 + 1, s.title, a.name, COALESCE(al.title, ''), s.lyrics "
+        "FROM music_song s JOIN music_artist a ON a.id = s.artist_id "
+        "LEFT JOIN music_album al ON al.id = s.album_id WHERE s.is_active"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS music_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarSong',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music.song')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='music.song')),
+            ],
+            options={
+                'ordering': ['song', 'rank'],
+                'unique_together': {('song', 'similar')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import music.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0005_song_ingest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(choices=[('opus', 'Opus'), ('aac', 'AAC')], max_length=10)),
+                ('bitrate', models.PositiveIntegerField()),
+                ('audio_file', models.FileField(blank=True, upload_to=music.models.rendition_upload_path)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='music.song')),
+            ],
+            options={
+                'ordering': ['song', 'codec', 'bitrate'],
+                'unique_together': {('song', 'codec', 'bitrate')},
+            },
+        ),
+    ]
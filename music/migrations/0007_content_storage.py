@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:20
+
+from django.db import migrations, models
+import music.models
+import music.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_songrendition'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='album',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=music.storage.content_storage, upload_to='albums/'),
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=music.storage.content_storage, upload_to='artists/'),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='audio_file',
+            field=models.FileField(storage=music.storage.content_storage, upload_to=music.models.song_upload_path),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=music.storage.content_storage, upload_to=music.models.cover_upload_path),
+        ),
+        migrations.AlterField(
+            model_name='songrendition',
+            name='audio_file',
+            field=models.FileField(blank=True, storage=music.storage.content_storage, upload_to=music.models.rendition_upload_path),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:23
+
+from django.db import migrations, models
+import music.models
+import music.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0007_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='waveform',
+            field=models.FileField(blank=True, storage=music.storage.content_storage, upload_to=music.models.waveform_upload_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_song_waveform'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='recentplay',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='recentplay',
+            name='played_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def parse_duration(value):
+    """Seconds in a "MM:SS" or "H:MM:SS" string; 0 when it isn't one"""
+    seconds = 0
+    try:
+        for part in (value or '').strip().split(':'):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return 0
+    return seconds
+
+
+def durations_to_seconds(apps, schema_editor):
+    Song = apps.get_model('music', 'Song')
+    songs = list(Song.objects.only('id', 'duration'))
+    for song in songs:
+        song.duration_seconds = parse_duration(song.duration)
+    Song.objects.bulk_update(songs, ['duration_seconds'], batch_size=500)
+
+
+def seconds_to_durations(apps, schema_editor):
+    Song = apps.get_model('music', 'Song')
+    songs = list(Song.objects.only('id', 'duration_seconds'))
+    for song in songs:
+        song.duration = f'{song.duration_seconds // 60:02d}:{song.duration_seconds % 60:02d}'
+    Song.objects.bulk_update(songs, ['duration'], batch_size=500)
+
+
+def fill_playlist_stats(apps, schema_editor):
+    Playlist = apps.get_model('music', 'Playlist')
+    PlaylistSong = apps.get_model('music', 'PlaylistSong')
+    for playlist in Playlist.objects.all():
+        entries = (PlaylistSong.objects.filter(playlist=playlist).select_related('song')
+                   .order_by('order', 'added_at'))
+        songs = [entry.song for entry in entries]
+        playlist.song_count = len(songs)
+        playlist.total_duration_seconds = sum(song.duration_seconds for song in songs)
+        playlist.cover_song = next((song for song in songs if song.cover_image), None)
+        playlist.save(update_fields=['song_count', 'total_duration_seconds', 'cover_song'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_recentplay_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='duration_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(durations_to_seconds, seconds_to_durations),
+        migrations.RemoveField(
+            model_name='song',
+            name='duration',
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='cover_song',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='music.song'),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='song_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='total_duration_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_playlist_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+ORDER_GAP = 1024
+
+
+def spread_orders(apps, schema_editor):
+    """Give existing entries gap-spaced order keys in their current order"""
+    PlaylistSong = apps.get_model('music', 'PlaylistSong')
+    playlist_ids = PlaylistSong.objects.values_list('playlist_id', flat=True).distinct()
+    for playlist_id in playlist_ids:
+        entries = list(PlaylistSong.objects.filter(playlist_id=playlist_id).order_by('order', 'added_at', 'id'))
+        for i, entry in enumerate(entries, start=1):
+            entry.order = i * ORDER_GAP
+        PlaylistSong.objects.bulk_update(entries, ['order'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_duration_seconds_playlist_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0011_playlistsong_gap_order'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlistsong',
+            index=models.Index(fields=['playlist', 'order', 'added_at'], name='playlistsong_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recentplay',
+            index=models.Index(fields=['user', '-played_at', '-id'], name='recentplay_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-plays_count', '-id'], name='song_active_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-uploaded_at', '-id'], name='song_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['artist', '-plays_count', '-id'], name='song_artist_popular_idx'),
+        ),
+    ]
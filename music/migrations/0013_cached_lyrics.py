@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='song',
+            name='lyrics_source',
+            field=models.CharField(choices=[('manual', 'Manual'), ('generated', 'AI Generated'), ('api', 'Lyrics API')], default='manual', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CachedLyrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('artist_key', models.CharField(max_length=255)),
+                ('title_key', models.CharField(max_length=255)),
+                ('lyrics', models.TextField(blank=True)),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('artist_key', 'title_key')},
+            },
+        ),
+    ]
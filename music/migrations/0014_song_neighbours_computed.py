@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+def mark_computed(apps, schema_editor):
+    Song = apps.get_model('music', 'Song')
+    SimilarSong = apps.get_model('music', 'SimilarSong')
+    Song.objects.filter(pk__in=SimilarSong.objects.values('song_id')).update(neighbours_computed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0013_cached_lyrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='neighbours_computed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_computed, migrations.RunPython.noop),
+    ]
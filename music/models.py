@@ -4,14 +4,24 @@ from django.db import models
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.urls import reverse
 import os
 
+from .storage import content_storage
+from .utils import format_duration
+
 def song_upload_path(instance, filename):
     return f'music/songs/{instance.artist}/{filename}'
 
 def cover_upload_path(instance, filename):
     return f'music/covers/{instance.artist}/{filename}'
 
+def rendition_upload_path(instance, filename):
+    return f'music/renditions/{instance.song_id}/{filename}'
+
+def waveform_upload_path(instance, filename):
+    return f'music/waveforms/{instance.pk}/{filename}'
+
 class Genre(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -25,7 +35,7 @@ class Genre(models.Model):
 class Artist(models.Model):
     name = models.CharField(max_length=200)
     bio = models.TextField(blank=True)
-    image = models.ImageField(upload_to='artists/', null=True, blank=True)
+    image = models.ImageField(upload_to='artists/', storage=content_storage, null=True, blank=True)
     
     class Meta:
         ordering = ['name']
@@ -36,7 +46,7 @@ class Artist(models.Model):
 class Album(models.Model):
     title = models.CharField(max_length=200)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='albums')
-    cover_image = models.ImageField(upload_to='albums/', null=True, blank=True)
+    cover_image = models.ImageField(upload_to='albums/', storage=content_storage, null=True, blank=True)
     release_date = models.DateField(null=True, blank=True)
     genre = models.ManyToManyField(Genre, blank=True)
     
@@ -46,44 +56,83 @@ class Album(models.Model):
     def __str__(self):
         return f"{self.title} - {self.artist.name}"
 
+class SongQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Everything a song card or row renders: artist and album"""
+        return self.select_related('artist', 'album')
+    
+    def with_genres(self):
+        return self.prefetch_related('genre')
+
 class Song(models.Model):
     title = models.CharField(max_length=200)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='songs')
     album = models.ForeignKey(Album, on_delete=models.SET_NULL, null=True, blank=True, related_name='songs')
     genre = models.ManyToManyField(Genre, blank=True)
-    audio_file = models.FileField(upload_to=song_upload_path)
-    cover_image = models.ImageField(upload_to=cover_upload_path, null=True, blank=True)
-    duration = models.CharField(max_length=10, blank=True)  # Store as "MM:SS"
+    audio_file = models.FileField(upload_to=song_upload_path, storage=content_storage)
+    cover_image = models.ImageField(upload_to=cover_upload_path, storage=content_storage, null=True, blank=True)
+    waveform = models.FileField(upload_to=waveform_upload_path, storage=content_storage, blank=True)  # int8 peaks
+    duration_seconds = models.PositiveIntegerField(default=0)
     lyrics = models.TextField(blank=True)
     lyrics_source = models.CharField(max_length=20, choices=[
         ('manual', 'Manual'),
         ('generated', 'AI Generated'),
+        ('api', 'Lyrics API'),
     ], default='manual')
     plays_count = models.PositiveIntegerField(default=0)
     likes_count = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # Set once the similarity job stored this song's neighbours, even none
+    neighbours_computed = models.BooleanField(default=False, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    ingest_status = models.CharField(max_length=10, choices=[
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ], default='ready')
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='uploaded_songs')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SongQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Home and API listings only ever show active songs: popular
+            # (?order=popular keyset pages) and recent
+            models.Index(fields=['-plays_count', '-id'], condition=models.Q(is_active=True),
+                         name='song_active_popular_idx'),
+            models.Index(fields=['-uploaded_at', '-id'], condition=models.Q(is_active=True),
+                         name='song_active_recent_idx'),
+            # Artist page: an artist's songs by popularity
+            models.Index(fields=['artist', '-plays_count', '-id'], name='song_artist_popular_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.artist.name}"
     
+    @property
+    def duration(self):
+        """Length as "MM:SS", for display"""
+        return format_duration(self.duration_seconds)
+    
     def get_audio_url(self):
-        return self.audio_file.url if self.audio_file else ''
+        return reverse('music:stream_song', args=[self.pk]) if self.audio_file else ''
     
-    def increment_plays(self):
-        self.plays_count += 1
-        self.save()
+    def increment_plays(self, count=1):
+        Song.objects.filter(pk=self.pk).update(plays_count=models.F('plays_count') + count)
+        self.refresh_from_db(fields=['plays_count'])
 
 class Playlist(models.Model):
     name = models.CharField(max_length=200)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlists')
     songs = models.ManyToManyField(Song, through='PlaylistSong')
     is_public = models.BooleanField(default=False)
+    # Denormalized from the songs; kept current by refresh_stats() (see signals)
+    song_count = models.PositiveIntegerField(default=0)
+    total_duration_seconds = models.PositiveIntegerField(default=0)
+    cover_song = models.ForeignKey(Song, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -92,6 +141,42 @@ class Playlist(models.Model):
     
     def __str__(self):
         return f"{self.name} - {self.user.username}"
+    
+    def ordered_songs(self):
+        """Songs in playlist order, ready for listing"""
+        return self.songs.for_listing().order_by('playlistsong__order', 'playlistsong__added_at')
+    
+    @property
+    def total_duration(self):
+        return format_duration(self.total_duration_seconds)
+    
+    def refresh_stats(self):
+        """Recompute song_count, total_duration_seconds and cover_song from the songs"""
+        stats = self.songs.aggregate(
+            count=models.Count('id'),
+            seconds=models.Sum('duration_seconds'),
+        )
+        self.song_count = stats['count']
+        self.total_duration_seconds = stats['seconds'] or 0
+        self.cover_song = (
+            self.songs.filter(is_active=True).exclude(cover_image='').exclude(cover_image=None)
+            .order_by('playlistsong__order', 'playlistsong__added_at').first()
+        )
+        # update() so refreshing doesn't bump updated_at or fire signals
+        Playlist.objects.filter(pk=self.pk).update(
+            song_count=self.song_count,
+            total_duration_seconds=self.total_duration_seconds,
+            cover_song=self.cover_song,
+        )
+    
+    @staticmethod
+    def first_cover():
+        """Subquery for the cover_song refresh_stats() would pick, for use in update()"""
+        return models.Subquery(
+            PlaylistSong.objects.filter(playlist=models.OuterRef('pk'), song__is_active=True)
+            .exclude(song__cover_image='').exclude(song__cover_image=None)
+            .order_by('order', 'added_at').values('song_id')[:1]
+        )
 
 class PlaylistSong(models.Model):
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE)
@@ -101,6 +186,9 @@ class PlaylistSong(models.Model):
     
     class Meta:
         ordering = ['order', 'added_at']
+        indexes = [
+            models.Index(fields=['playlist', 'order', 'added_at'], name='playlistsong_order_idx'),
+        ]
 
 class UserSongInteraction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -113,10 +201,73 @@ class UserSongInteraction(models.Model):
         unique_together = ['user', 'song']
 
 class RecentPlay(models.Model):
+    """One play in a user's listening history, trimmed to the last few (see music.history)"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recent_plays')
     song = models.ForeignKey(Song, on_delete=models.CASCADE)
-    played_at = models.DateTimeField(auto_now_add=True)
+    played_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-played_at']
-        unique_together = ['user', 'song']
\ No newline at end of file
+        indexes = [
+            # History reads, now_playing and trimming: one user's newest plays
+            models.Index(fields=['user', '-played_at', '-id'], name='recentplay_user_recent_idx'),
+        ]
+
+class SimilarSong(models.Model):
+    """Precomputed nearest neighbours of a song, best first"""
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['song', 'rank']
+        unique_together = ['song', 'similar']
+
+class Recommendation(models.Model):
+    """Personalized song recommendations, produced offline, best first"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['user', 'rank']
+        unique_together = ['user', 'song']
+
+class SongRendition(models.Model):
+    """A transcoded, lower-bitrate copy of a song's audio file"""
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='renditions')
+    codec = models.CharField(max_length=10, choices=[
+        ('opus', 'Opus'),
+        ('aac', 'AAC'),
+    ])
+    bitrate = models.PositiveIntegerField()  # kbps
+    audio_file = models.FileField(upload_to=rendition_upload_path, storage=content_storage, blank=True)
+    status = models.CharField(max_length=10, choices=[
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ], default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['song', 'codec', 'bitrate']
+        unique_together = ['song', 'codec', 'bitrate']
+    
+    def __str__(self):
+        return f"{self.song.title} ({self.codec} {self.bitrate}k)"
+
+
+class CachedLyrics(models.Model):
+    """A lyrics provider's answer for an (artist, title), including that it had none"""
+    artist_key = models.CharField(max_length=255)
+    title_key = models.CharField(max_length=255)
+    lyrics = models.TextField(blank=True)  # empty when the provider had none
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['artist_key', 'title_key']
+
+    def __str__(self):
+        return f"{self.title_key} - {self.artist_key}"
@@ -0,0 +1,98 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+SONGS_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+# Keyset orderings for the big song listings; the pk makes each one total
+SONG_ORDERINGS = {
+    'recent': ('-uploaded_at', '-id'),
+    'popular': ('-plays_count', '-id'),
+}
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """One page of a keyset listing plus the cursor to the next one"""
+
+    def __init__(self, object_list, next_cursor, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination over a fixed ordering.
+
+    Instead of OFFSET, each page filters on the sort key of the last row of
+    the previous page, so fetching page 1000 costs the same as page 1 when an
+    index matches the ordering. Cursors are opaque url-safe strings.
+    """
+
+    def __init__(self, queryset, ordering, per_page=SONGS_PER_PAGE):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in ordering]
+
+    def encode(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            model = self.queryset.model
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def after(self, values):
+        """Q selecting rows that sort strictly after `values`"""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            field = self.fields[i]
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prior in range(i):
+                step &= Q(**{self.fields[prior]: values[prior]})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode(cursor)))
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = self.encode(rows[self.per_page - 1]) if len(rows) > self.per_page else None
+        return KeysetPage(rows[:self.per_page], next_cursor, cursor)
+
+
+def per_page_from(request, default=SONGS_PER_PAGE):
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), MAX_PER_PAGE))
+    except ValueError:
+        return default
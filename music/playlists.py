@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models import Max
+
+from .models import PlaylistSong
+
+# Spacing between consecutive order keys; a run of moves into one spot can
+# halve it about ten times before the playlist has to be renumbered
+ORDER_GAP = 1024
+
+
+class InvalidMove(ValueError):
+    pass
+
+
+def next_order(playlist):
+    """Order key that puts a new song at the end of `playlist`"""
+    last = PlaylistSong.objects.filter(playlist=playlist).aggregate(last=Max('order'))['last']
+    return (last or 0) + ORDER_GAP
+
+
+def renumber(playlist, gap=ORDER_GAP):
+    """Spread every entry of `playlist` `gap` apart, keeping the current order"""
+    entries = list(PlaylistSong.objects.filter(playlist=playlist).order_by('order', 'added_at', 'id'))
+    for i, entry in enumerate(entries, start=1):
+        entry.order = i * gap
+    PlaylistSong.objects.bulk_update(entries, ['order'], batch_size=500)
+
+
+def gap_for(playlist, moved_song_ids, before):
+    """
+    The (low, high) order keys the moved songs must fit strictly between:
+    just before the song `before`, or after the last song when it's None.
+    """
+    others = PlaylistSong.objects.filter(playlist=playlist).exclude(song_id__in=moved_song_ids)
+    if before is None:
+        low = others.aggregate(last=Max('order'))['last'] or 0
+        return low, low + ORDER_GAP * (len(moved_song_ids) + 1)
+
+    target = others.filter(song_id=before).values_list('order', flat=True).first()
+    if target is None:
+        raise InvalidMove(f'Song {before} is not in the playlist or is being moved')
+    low = others.filter(order__lt=target).aggregate(last=Max('order'))['last'] or 0
+    return low, target
+
+
+def move_songs(playlist, song_ids, before=None):
+    """
+    Move `song_ids` (in that order) to just before the song `before`, or to
+    the end. Only the moved rows are rewritten, with keys spaced evenly in
+    the gap; the playlist is renumbered only when that gap is too small.
+    """
+    song_ids = list(dict.fromkeys(song_ids))
+    entries = {
+        entry.song_id: entry
+        for entry in PlaylistSong.objects.filter(playlist=playlist, song_id__in=song_ids)
+    }
+    missing = [song_id for song_id in song_ids if song_id not in entries]
+    if missing:
+        raise InvalidMove(f'Songs not in the playlist: {missing}')
+    if not song_ids:
+        return
+
+    low, high = gap_for(playlist, song_ids, before)
+    step = (high - low) // (len(song_ids) + 1)
+    if step < 1:
+        # Leave room for the whole block between any two neighbours
+        renumber(playlist, ORDER_GAP * (len(song_ids) // ORDER_GAP + 1))
+        entries = {
+            entry.song_id: entry
+            for entry in PlaylistSong.objects.filter(playlist=playlist, song_id__in=song_ids)
+        }
+        low, high = gap_for(playlist, song_ids, before)
+        step = (high - low) // (len(song_ids) + 1)
+
+    moved = []
+    for i, song_id in enumerate(song_ids, start=1):
+        entry = entries[song_id]
+        entry.order = low + step * i
+        moved.append(entry)
+    PlaylistSong.objects.bulk_update(moved, ['order'])
+
+
+def apply_moves(playlist, moves):
+    """
+    Apply a list of {'songs': [...], 'before': song_id or None} moves in one
+    transaction, in order; either all of them land or none do.
+    """
+    with transaction.atomic():
+        for move in moves:
+            before = move.get('before')
+            move_songs(
+                playlist,
+                [int(song_id) for song_id in move.get('songs', [])],
+                int(before) if before is not None else None,
+            )
+        # bulk_update skips signals; the first covered song may have changed
+        playlist.refresh_stats()
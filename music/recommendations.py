@@ -0,0 +1,90 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from . import factorization
+from .models import RecentPlay, Recommendation, UserSongInteraction
+
+TOP_K = 20
+CHUNK_SIZE = 1000
+
+
+def interaction_matrix():
+    """
+    Sparse user x song confidence matrix.
+
+    Confidence grows with log(play count), a like adds a strong positive and
+    each recent play adds a little more.
+    """
+    confidence = Counter()
+    interactions = UserSongInteraction.objects.filter(song__is_active=True).values_list(
+        'user_id', 'song_id', 'play_count', 'is_liked'
+    )
+    for user_id, song_id, plays, liked in interactions:
+        confidence[(user_id, song_id)] += np.log1p(plays) + (2.0 if liked else 0.0)
+    recent = RecentPlay.objects.filter(song__is_active=True).values_list('user_id', 'song_id').distinct()
+    for user_id, song_id in recent:
+        confidence[(user_id, song_id)] += 0.5
+
+    user_ids = sorted({user_id for user_id, _ in confidence})
+    song_ids = sorted({song_id for _, song_id in confidence})
+    user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+    song_index = {song_id: i for i, song_id in enumerate(song_ids)}
+
+    rows = [user_index[user_id] for user_id, _ in confidence]
+    cols = [song_index[song_id] for _, song_id in confidence]
+    matrix = sparse.csr_matrix(
+        (list(confidence.values()), (rows, cols)), shape=(len(user_ids), len(song_ids))
+    )
+    return matrix, np.array(user_ids), np.array(song_ids)
+
+
+def build_recommendations(factors=32, top_k=TOP_K, workers=None):
+    """
+    Factorize the interaction matrix and store the top K songs per user.
+
+    Scoring is split into user chunks and run across a process pool; each
+    worker receives the item factors once, at start-up. Returns the number
+    of users that got recommendations.
+    """
+    matrix, user_ids, song_ids = interaction_matrix()
+    if matrix.nnz == 0:
+        return 0
+    user_factors, item_factors = factorization.factorize(matrix, factors)
+
+    chunks = []
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        seen = [matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]] for i in range(start, min(stop, len(user_ids)))]
+        chunks.append((user_factors[start:stop], seen))
+
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=factorization.init_worker,
+        initargs=(item_factors,),
+    ) as pool:
+        futures = [pool.submit(factorization.top_k, rows, seen, top_k) for rows, seen in chunks]
+        results = [result for future in futures for result in future.result()]
+
+    recommendations = [
+        Recommendation(user_id=int(user_id), song_id=int(song_ids[item]), score=float(score), rank=rank)
+        for user_id, (items, scores) in zip(user_ids, results)
+        for rank, (item, score) in enumerate(zip(items, scores))
+    ]
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        Recommendation.objects.bulk_create(recommendations, batch_size=1000)
+    return sum(1 for items, _ in results if len(items))
+
+
+def recommended_songs_for(user, limit=10):
+    """Stored recommendations for `user`, in one indexed lookup"""
+    return [
+        recommendation.song for recommendation in
+        Recommendation.objects.filter(user=user, song__is_active=True)
+        .select_related('song__artist')[:limit]
+    ]
@@ -0,0 +1,171 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Album, Artist, Song
+from .pagination import SONGS_PER_PAGE
+
+GROUP_LIMIT = 10
+
+
+class BaseSearchBackend:
+    """
+    Interface for catalogue search backends.
+
+    `search()` returns a dict with a `songs` Page plus ranked `artists` and
+    `albums` lists. The index_* / remove hooks are called from model signals
+    so backends that keep their own index can stay current.
+    """
+
+    def search(self, query, page=1, per_page=SONGS_PER_PAGE):
+        raise NotImplementedError
+
+    def index_song(self, song):
+        pass
+
+    def index_artist(self, artist):
+        pass
+
+    def index_album(self, album):
+        pass
+
+    def remove(self, instance):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Plain icontains lookups; works on any database but scans every row"""
+
+    def search(self, query, page=1, per_page=SONGS_PER_PAGE):
+        songs = Song.objects.filter(
+            Q(title__icontains=query) |
+            Q(artist__name__icontains=query) |
+            Q(album__title__icontains=query),
+            is_active=True
+        ).for_listing().distinct()
+        return {
+            'songs': Paginator(songs, per_page).get_page(page),
+            'artists': list(Artist.objects.filter(name__icontains=query)[:GROUP_LIMIT]),
+            'albums': list(Album.objects.filter(title__icontains=query)
+                           .select_related('artist')[:GROUP_LIMIT]),
+        }
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index over songs, artists and albums.
+
+    All three kinds live in one virtual table; the rowid encodes both the
+    kind and the primary key (pk * 4 + kind), so a single ranked MATCH
+    answers every result group and updates are keyed deletes.
+    """
+
+    table = 'music_search_index'
+    kinds = {Song: 1, Artist: 2, Album: 3}
+    # bm25 column weights: title, artist, album, lyrics
+    weights = (10.0, 5.0, 3.0, 1.0)
+    max_matches = 1000
+
+    def rowid(self, instance):
+        return instance.pk * 4 + self.kinds[type(instance)]
+
+    def match_expression(self, query):
+        """Turn free text into an FTS5 query: every word, as a prefix"""
+        terms = re.findall(r'\w+', query.lower())
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, query, page=1, per_page=SONGS_PER_PAGE):
+        match = self.match_expression(query)
+        rows = []
+        if match:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                    f'ORDER BY bm25({self.table}, %s, %s, %s, %s) LIMIT %s',
+                    [match, *self.weights, self.max_matches],
+                )
+                rows = [row[0] for row in cursor.fetchall()]
+
+        ranked = {kind: [] for kind in self.kinds.values()}
+        for rowid in rows:
+            ranked[rowid % 4].append(rowid // 4)
+
+        songs = Paginator(ranked[self.kinds[Song]], per_page).get_page(page)
+        songs.object_list = self.fetch(
+            Song.objects.for_listing(), songs.object_list
+        )
+        return {
+            'songs': songs,
+            'artists': self.fetch(Artist.objects.all(), ranked[self.kinds[Artist]][:GROUP_LIMIT]),
+            'albums': self.fetch(Album.objects.select_related('artist'),
+                                 ranked[self.kinds[Album]][:GROUP_LIMIT]),
+        }
+
+    def fetch(self, queryset, ids):
+        """Load `ids` in one query, keeping the rank order"""
+        objects = queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def write(self, instance, title, artist='', album='', lyrics=''):
+        rowid = self.rowid(instance)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [rowid])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, artist, album, lyrics) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [rowid, title, artist, album, lyrics],
+            )
+
+    def index_song(self, song):
+        if not song.is_active:
+            self.remove(song)
+            return
+        self.write(
+            song,
+            song.title,
+            song.artist.name,
+            song.album.title if song.album else '',
+            song.lyrics,
+        )
+
+    def index_artist(self, artist):
+        self.write(artist, artist.name)
+
+    def index_album(self, album):
+        self.write(album, album.title, album.artist.name)
+
+    def remove(self, instance):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self.rowid(instance)])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        count = 0
+        for artist in Artist.objects.iterator():
+            self.index_artist(artist)
+            count += 1
+        for album in Album.objects.select_related('artist').iterator():
+            self.index_album(album)
+            count += 1
+        for song in Song.objects.filter(is_active=True).for_listing().iterator():
+            self.index_song(song)
+            count += 1
+        return count
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """The configured search backend, falling back to plain lookups off SQLite"""
+    backend = import_string(getattr(settings, 'SEARCH_BACKEND', 'music.search.DatabaseSearchBackend'))
+    if issubclass(backend, SQLiteFTSSearchBackend) and connection.vendor != 'sqlite':
+        backend = DatabaseSearchBackend
+    return backend()
@@ -0,0 +1,197 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models import F, FileField, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import receiver
+
+from .cache import bump_catalogue_version
+from .db import configure_connection
+from .models import Album, Artist, Genre, Playlist, PlaylistSong, Song, SongRendition
+from .autocomplete import autocomplete_index
+from .search import get_search_backend
+from .similarity import similarity_updates
+from .storage import release
+from .tasks import submit
+from .thumbnails import IMAGE_FIELDS, generate_for, is_ready
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+@receiver(post_save, sender=Song)
+def index_song(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index_song(instance)
+    autocomplete_index.update_song(instance)
+
+
+@receiver(post_save, sender=Artist)
+def index_artist(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    autocomplete_index.update_artist(instance)
+    backend = get_search_backend()
+    backend.index_artist(instance)
+    # Songs and albums carry the artist name in their index rows
+    for album in instance.albums.all():
+        backend.index_album(album)
+    for song in instance.songs.filter(is_active=True).select_related('album'):
+        backend.index_song(song)
+
+
+@receiver(post_save, sender=Album)
+def index_album(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    autocomplete_index.update_album(instance)
+    backend = get_search_backend()
+    backend.index_album(instance)
+    for song in instance.songs.filter(is_active=True).select_related('artist'):
+        backend.index_song(song)
+
+
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Album)
+def unindex(sender, instance, **kwargs):
+    get_search_backend().remove(instance)
+    autocomplete_index.discard(instance)
+
+
+@receiver(post_save, sender=Song)
+def song_changed(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        similarity_updates.mark(instance.pk)
+
+
+@receiver(m2m_changed, sender=Song.genre.through)
+def song_genres_changed(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        similarity_updates.mark(instance.pk)
+    elif pk_set:
+        similarity_updates.mark(*pk_set)
+
+
+@receiver(post_save, sender=PlaylistSong)
+@receiver(post_delete, sender=PlaylistSong)
+def playlist_songs_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        similarity_updates.mark(instance.song_id)
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_delete, sender=Song)
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def catalogue_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_catalogue_version()
+
+
+@receiver(m2m_changed, sender=Song.genre.through)
+def catalogue_genres_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalogue_version()
+
+
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=SongRendition)
+def release_files(sender, instance, **kwargs):
+    release(*(
+        field.value_from_object(instance).name
+        for field in sender._meta.get_fields()
+        if isinstance(field, FileField)
+    ))
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+def make_thumbnails(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    for kind, (model, field) in IMAGE_FIELDS.items():
+        image = getattr(instance, field) if sender is model else None
+        if image and not is_ready(image.name):
+            submit(generate_for, kind, instance.pk)
+
+
+# Playlist stats follow membership changes with F() deltas, so adding or
+# removing n rows costs O(n) small updates rather than n full refreshes. The
+# cover is only looked up again when it may have changed.
+
+@receiver(m2m_changed, sender=Playlist.songs.through)
+def playlist_songs_added(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    # add() bulk-creates rows without post_save; removals arrive as post_delete below
+    if action != 'post_add' or not pk_set:
+        return
+    if not reverse:
+        songs = Song.objects.filter(pk__in=pk_set)
+        seconds = songs.aggregate(seconds=Sum('duration_seconds'))['seconds'] or 0
+        covered = songs.filter(is_active=True).exclude(cover_image='').exclude(cover_image=None).exists()
+        shift_stats(Playlist.objects.filter(pk=instance.pk), len(pk_set), seconds, covered)
+    else:
+        shift_stats(Playlist.objects.filter(pk__in=pk_set), 1, instance.duration_seconds,
+                    instance.is_active and bool(instance.cover_image))
+
+
+@receiver(post_save, sender=PlaylistSong)
+def playlist_entry_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    playlists = Playlist.objects.filter(pk=instance.playlist_id)
+    if created:
+        song = instance.song
+        shift_stats(playlists, 1, song.duration_seconds, song.is_active and bool(song.cover_image))
+    else:
+        # A moved entry may now come before the cover
+        playlists.update(cover_song=Playlist.first_cover())
+
+
+@receiver(post_delete, sender=PlaylistSong)
+def playlist_entry_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Playlist):
+        return  # the playlist itself is going
+    playlists = Playlist.objects.filter(pk=instance.playlist_id)
+    cover_gone = Q(cover_song_id=instance.song_id)
+    if isinstance(origin, Song):
+        # Deleting the song has already set cover_song to NULL (SET_NULL)
+        cover_gone |= Q(cover_song=None)
+    playlists.update(
+        song_count=F('song_count') - 1,
+        total_duration_seconds=F('total_duration_seconds') - Coalesce(
+            Subquery(Song.objects.filter(pk=instance.song_id).values('duration_seconds')), 0
+        ),
+    )
+    playlists.filter(cover_gone).update(cover_song=Playlist.first_cover())
+
+
+@receiver(post_save, sender=Song)
+def song_cover_changed(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if created or raw or (update_fields is not None and not {'cover_image', 'is_active'} & set(update_fields)):
+        return
+    affected = Q(cover_song=instance)
+    if instance.is_active and instance.cover_image:
+        affected |= Q(playlistsong__song=instance)
+    Playlist.objects.filter(affected).update(cover_song=Playlist.first_cover())
+
+
+def shift_stats(playlists, count, seconds, covered):
+    """Add `count` songs lasting `seconds` to each playlist; `covered` if one has a cover"""
+    playlists.update(
+        song_count=F('song_count') + count,
+        total_duration_seconds=F('total_duration_seconds') + seconds,
+    )
+    if covered:
+        playlists.update(cover_song=Playlist.first_cover())
@@ -0,0 +1,280 @@
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from scipy import sparse
+
+from .buffers import WriteBehindBuffer
+from .db import serialized_write
+from .models import PlaylistSong, SimilarSong, Song, UserSongInteraction
+
+TOP_N = 20
+
+# Relative weight of each signal in the combined score
+WEIGHTS = {
+    'genre': 1.0,
+    'artist': 0.8,
+    'playlist': 0.6,
+    'listener': 0.4,
+}
+
+
+def normalize_rows(matrix):
+    """L2-normalize the rows of a sparse matrix so dot products are cosines"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+def incidence(pairs, row_index, weights=None):
+    """Sparse song x feature matrix from (song_id, feature_id) pairs"""
+    rows, cols, data = [], [], []
+    columns = {}
+    for i, (song_id, feature_id) in enumerate(pairs):
+        if song_id not in row_index:
+            continue
+        rows.append(row_index[song_id])
+        cols.append(columns.setdefault(feature_id, len(columns)))
+        data.append(1.0 if weights is None else weights[i])
+    return sparse.csr_matrix(
+        (data, (rows, cols)), shape=(len(row_index), max(len(columns), 1))
+    )
+
+
+def listened():
+    return UserSongInteraction.objects.filter(Q(play_count__gt=0) | Q(is_liked=True))
+
+
+def feature_matrix(songs=None):
+    """
+    Build the combined feature matrix for every active song, or for the
+    active songs of the `songs` queryset.
+
+    Each signal is its own row-normalized block scaled by sqrt(weight), so
+    the dot product of two rows is the weighted sum of per-signal cosine
+    similarities: shared genres, same artist, co-occurrence in playlists
+    and co-listening by the same users.
+    """
+    scope = {} if songs is None else {'song_id__in': songs.values('pk')}
+    songs = (Song.objects.all() if songs is None else songs).filter(is_active=True)
+    songs = list(songs.values_list('id', 'artist_id'))
+    song_ids = np.array([song_id for song_id, _ in songs], dtype=np.int64)
+    row_index = {song_id: i for i, song_id in enumerate(song_ids)}
+
+    interactions = list(
+        listened().filter(**scope).values_list('song_id', 'user_id', 'play_count', 'is_liked')
+    )
+    blocks = {
+        'genre': incidence(
+            Song.genre.through.objects.filter(**scope).values_list('song_id', 'genre_id'), row_index
+        ),
+        'artist': incidence(songs, row_index),
+        'playlist': incidence(
+            PlaylistSong.objects.filter(**scope).values_list('song_id', 'playlist_id'), row_index
+        ),
+        'listener': incidence(
+            [(song_id, user_id) for song_id, user_id, _, _ in interactions],
+            row_index,
+            weights=[np.log1p(plays) + (2.0 if liked else 0.0) for _, _, plays, liked in interactions],
+        ),
+    }
+    matrix = sparse.hstack(
+        [normalize_rows(blocks[name]) * np.sqrt(weight) for name, weight in WEIGHTS.items()],
+        format='csr',
+    )
+    return song_ids, row_index, matrix
+
+
+def affected_songs(song_ids):
+    """
+    Active songs whose score against any of `song_ids` can be non-zero or has
+    changed: the songs themselves, those sharing a genre, the artist, a
+    playlist or a listener with them, and those currently listing them.
+    """
+    genres = Song.genre.through.objects
+    return Song.objects.filter(is_active=True).filter(
+        Q(pk__in=song_ids)
+        | Q(artist__in=Song.objects.filter(pk__in=song_ids).values('artist_id'))
+        | Q(pk__in=genres.filter(
+            genre__in=genres.filter(song_id__in=song_ids).values('genre_id')).values('song_id'))
+        | Q(pk__in=PlaylistSong.objects.filter(
+            playlist__in=PlaylistSong.objects.filter(song_id__in=song_ids).values('playlist_id')
+        ).values('song_id'))
+        | Q(pk__in=listened().filter(
+            user__in=listened().filter(song_id__in=song_ids).values('user_id')).values('song_id'))
+        | Q(pk__in=SimilarSong.objects.filter(similar_id__in=song_ids).values('song_id'))
+    )
+
+
+def scored_rows(matrix, targets):
+    """(row, columns, scores) of the non-zero scores of each target row, itself excluded"""
+    # Score in blocks to keep the product matrix small
+    for start in range(0, len(targets), 512):
+        block = targets[start:start + 512]
+        scores = (matrix[block] @ matrix.T).tocsr()
+        for offset, row in enumerate(block):
+            data = scores.data[scores.indptr[offset]:scores.indptr[offset + 1]]
+            cols = scores.indices[scores.indptr[offset]:scores.indptr[offset + 1]]
+            keep = (cols != row) & (data > 0)
+            yield row, cols[keep], data[keep]
+
+
+def best(cols, data, top_n):
+    """The top_n highest scores, best first"""
+    if len(data) > top_n:
+        top = np.argpartition(-data, top_n)[:top_n]
+        data, cols = data[top], cols[top]
+    order = np.argsort(-data, kind='stable')
+    return cols[order], data[order]
+
+
+def compute_neighbours(song_ids=None, top_n=TOP_N):
+    """
+    Score songs against the songs they can be similar to and keep the top N
+    per song.
+
+    Returns {song_id: [(similar_id, score), ...]} for `song_ids`, or for every
+    active song when None.
+    """
+    if song_ids is None:
+        all_ids, row_index, matrix = feature_matrix()
+        targets = np.arange(len(all_ids))
+    else:
+        all_ids, row_index, matrix = feature_matrix(affected_songs(song_ids))
+        targets = np.array([row_index[song_id] for song_id in song_ids if song_id in row_index], dtype=np.int64)
+
+    neighbours = {}
+    for row, cols, data in scored_rows(matrix, targets):
+        cols, data = best(cols, data, top_n)
+        neighbours[int(all_ids[row])] = [(int(all_ids[col]), float(score)) for col, score in zip(cols, data)]
+    return neighbours
+
+
+def update_neighbours(song_ids, top_n=TOP_N):
+    """
+    Refresh neighbour lists after the features of `song_ids` changed.
+
+    Only those songs are scored, against the songs they share a feature with.
+    The other computed lists they appear in, or now belong in, are re-ranked
+    with the new scores; a full list that may have lost its true last entry
+    is recomputed instead. Returns {song_id: [(similar_id, score), ...]} of
+    every list that changed.
+    """
+    changed = set(song_ids)
+    affected = affected_songs(changed)
+    all_ids, row_index, matrix = feature_matrix(affected)
+    targets = np.array([row_index[song_id] for song_id in changed if song_id in row_index], dtype=np.int64)
+
+    neighbours = {}
+    rescored = defaultdict(dict)  # other song -> {changed song: new score}
+    for row, cols, data in scored_rows(matrix, targets):
+        song_id = int(all_ids[row])
+        for col, score in zip(cols, data):
+            rescored[int(all_ids[col])][song_id] = float(score)
+        cols, data = best(cols, data, top_n)
+        neighbours[song_id] = [(int(all_ids[col]), float(score)) for col, score in zip(cols, data)]
+
+    others = affected.filter(neighbours_computed=True).exclude(pk__in=changed)
+    stored = defaultdict(list)
+    for song_id, similar_id, score in (
+        SimilarSong.objects.filter(song__in=others).order_by('song', 'rank')
+        .values_list('song_id', 'similar_id', 'score')
+    ):
+        stored[song_id].append((similar_id, score))
+
+    recompute = []
+    for song_id in others.values_list('pk', flat=True):
+        entries = stored[song_id]
+        merged = sorted(
+            [entry for entry in entries if entry[0] not in changed] + list(rescored[song_id].items()),
+            key=lambda entry: -entry[1],
+        )[:top_n]
+        # Unstored songs score at most the old last entry; below it they might win
+        if len(entries) == top_n and (len(merged) < top_n or merged[-1][1] < entries[-1][1]):
+            recompute.append(song_id)
+        elif merged != entries:
+            neighbours[song_id] = merged
+    if recompute:
+        neighbours.update(compute_neighbours(recompute, top_n))
+    return neighbours
+
+
+def store_neighbours(neighbours):
+    """Replace the stored neighbour lists of the given songs"""
+    serialized_write(_store_neighbours, neighbours)
+
+
+def _store_neighbours(neighbours):
+    song_ids = list(neighbours)
+    with transaction.atomic():
+        for start in range(0, len(song_ids), 500):
+            chunk = song_ids[start:start + 500]
+            SimilarSong.objects.filter(song_id__in=chunk).delete()
+            Song.objects.filter(pk__in=chunk, neighbours_computed=False).update(neighbours_computed=True)
+        SimilarSong.objects.bulk_create(
+            [
+                SimilarSong(song_id=song_id, similar_id=similar_id, score=score, rank=rank)
+                for song_id, entries in neighbours.items()
+                for rank, (similar_id, score) in enumerate(entries)
+            ],
+            batch_size=1000,
+        )
+
+
+def rebuild_similar_songs(song_ids=None):
+    """Recompute every neighbour list, or refresh those touched by changes to `song_ids`"""
+    neighbours = compute_neighbours() if song_ids is None else update_neighbours(song_ids)
+    store_neighbours(neighbours)
+    return len(neighbours)
+
+
+class SimilarityUpdates(WriteBehindBuffer):
+    """Collects songs whose neighbours are stale and recomputes them in batches"""
+
+    interval_setting = 'SIMILARITY_FLUSH_INTERVAL'
+    max_pending_setting = 'SIMILARITY_MAX_PENDING'
+    default_interval = 60
+    default_max_pending = 1000
+    # Mostly computation; only store_neighbours needs the writer
+    serialized = False
+
+    def empty(self):
+        return set()
+
+    def collect(self, pending, song_ids):
+        pending.update(song_ids)
+
+    def merge(self, pending, batch):
+        pending.update(batch)
+
+    def mark(self, *song_ids):
+        self.add(song_ids)
+
+    def write(self, batch):
+        rebuild_similar_songs(batch)
+
+
+similarity_updates = SimilarityUpdates()
+
+
+def similar_songs_for(song, limit=5):
+    """Precomputed neighbours of `song`, falling back to same artist/genre"""
+    songs = [
+        entry.similar for entry in
+        SimilarSong.objects.filter(song=song, similar__is_active=True)
+        .select_related('similar__artist')[:limit]
+    ]
+    if songs:
+        return songs
+
+    # Not computed yet: queue it; computed but empty: nothing to wait for.
+    # Either way answer with the cheap heuristic
+    if not song.neighbours_computed:
+        similarity_updates.mark(song.id)
+    return list(
+        Song.objects.filter(
+            Q(artist=song.artist) | Q(genre__in=song.genre.all()),
+            is_active=True
+        ).exclude(id=song.id).select_related('artist').distinct()[:limit]
+    )
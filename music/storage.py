@@ -0,0 +1,192 @@
+import hashlib
+import os
+import time
+import uuid
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Every file field that may point into content-addressed storage
+FILE_FIELDS = [
+    ('music.Song', 'audio_file'),
+    ('music.Song', 'cover_image'),
+    ('music.Song', 'waveform'),
+    ('music.Album', 'cover_image'),
+    ('music.Artist', 'image'),
+    ('music.SongRendition', 'audio_file'),
+]
+
+# Suffix of a file being deleted, see ContentAddressedStorage.delete_unreferenced
+ASIDE_SUFFIX = '.deleting'
+
+
+class ContentAddressedMixin:
+    """
+    Stores each file under the SHA-256 of its bytes, so identical uploads
+    share one copy and a file's URL changes only when its content does.
+
+    Names look like `cas/ab/cd/abcd…ef.mp3`; the name produced by the
+    field's upload_to only contributes the extension. Saving content that is
+    already stored just returns the existing name. Deleting is left to
+    `release()`, which checks that no row references the file any more.
+
+    An upload that reuses a file only references it once its row commits, so
+    reusing a file claims it and collection spares files claimed or written
+    in the last CONTENT_GC_GRACE seconds.
+    """
+
+    prefix = 'cas'
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.prefix}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name) and self.claim(name):
+            return name
+        return self._save(name, content)
+
+    def is_content_addressed(self, name):
+        return bool(name) and name.startswith(self.prefix + '/')
+
+    def claim(self, name):
+        """Mark a stored file as just reused; False when it's gone meanwhile"""
+        return True
+
+    def in_grace(self, modified):
+        return time.time() - modified.timestamp() < gc_grace()
+
+    def delete_unreferenced(self, name, references):
+        """
+        Delete `name` unless `references(name)` finds a row pointing at it or
+        it is within the grace period; returns whether it was deleted. Checking
+        and deleting aren't atomic here; storages that can move files should
+        override this like ContentAddressedStorage does.
+        """
+        try:
+            if self.in_grace(self.get_modified_time(name)) or references(name):
+                return False
+        except FileNotFoundError:
+            return False
+        self.delete(name)
+        return True
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    def claim(self, name):
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete_unreferenced(self, name, references):
+        # Move the file aside before the last checks: an upload reusing it
+        # either claimed it already (fresh mtime, so it is put back) or finds
+        # it missing and writes it again
+        path = self.path(name)
+        aside = f'{path}.{uuid.uuid4().hex}{ASIDE_SUFFIX}'
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.path.getmtime(aside) < gc_grace() or references(name):
+            os.replace(aside, path)
+            return False
+        os.remove(aside)
+        return True
+
+
+def gc_grace():
+    return getattr(settings, 'CONTENT_GC_GRACE', 3600)
+
+
+@lru_cache(maxsize=None)
+def get_content_storage():
+    """The storage used by the catalogue's file fields"""
+    backend = getattr(settings, 'CONTENT_STORAGE', 'music.storage.ContentAddressedStorage')
+    return import_string(backend)()
+
+
+def content_storage():
+    # Plain function so file fields can reference it from migrations
+    return get_content_storage()
+
+
+def file_references(name):
+    """How many rows, across every catalogue file field, point at `name`"""
+    return sum(
+        apps.get_model(model).objects.filter(**{field: name}).count()
+        for model, field in FILE_FIELDS
+    )
+
+
+def referenced_names():
+    names = set()
+    for model, field in FILE_FIELDS:
+        names.update(apps.get_model(model).objects.exclude(**{field: ''})
+                      .values_list(field, flat=True).distinct())
+    return names
+
+
+def release(*names):
+    """
+    Delete content-addressed files that nothing references any more.
+
+    Runs once the surrounding transaction commits, so a rolled-back delete
+    never loses a file. Files written or reused within the grace period are
+    left for `collect_garbage()`. Files outside the content-addressed prefix (e.g.
+    libraries imported in place) are never touched.
+    """
+    storage = get_content_storage()
+    names = {name for name in names if getattr(storage, 'is_content_addressed', lambda n: False)(name)}
+    if not names:
+        return
+
+    def collect():
+        for name in names:
+            if not file_references(name):
+                storage.delete_unreferenced(name, file_references)
+
+    transaction.on_commit(collect)
+
+
+def collect_garbage(dry_run=False):
+    """Delete every content-addressed file no row references; returns their names"""
+    storage = get_content_storage()
+    if not hasattr(storage, 'is_content_addressed'):
+        return []
+    referenced = referenced_names()
+    orphans = [
+        name for name in walk(storage, storage.prefix)
+        if name not in referenced and not name.endswith(ASIDE_SUFFIX)
+        and not storage.in_grace(storage.get_modified_time(name))
+    ]
+    if dry_run:
+        return orphans
+    return [name for name in orphans if storage.delete_unreferenced(name, file_references)]
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for filename in files:
+        yield f'{directory}/{filename}'
+    for subdirectory in directories:
+        yield from walk(storage, f'{directory}/{subdirectory}')
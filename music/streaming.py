@@ -0,0 +1,159 @@
+import mimetypes
+import re
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """File wrapper that stops reading after `length` bytes from the current position"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.name = getattr(file, 'name', None)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+async def aiter_file(file, length, chunk_size=FileResponse.block_size):
+    """
+    Yield `length` bytes of `file` from its current position. Reads run in
+    the executor's worker threads, off the event loop and not serialized
+    behind the request's thread-sensitive ORM calls.
+    """
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while length > 0:
+            chunk = await read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+
+def make_etag(size, mtime):
+    """Strong validator built from the file size and modification time"""
+    return '"%x-%x"' % (size, int(mtime))
+
+
+def parse_range(header, size):
+    """
+    Parse a single `bytes=` range against a resource of `size` bytes.
+
+    Returns (start, end) inclusive, None when the header should be ignored
+    (absent, malformed or multi-range), or False when it is unsatisfiable.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether an If-Range precondition (if any) still matches the file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # If-Range requires a strong comparison
+        return not if_range.startswith('W/') and if_range in parse_etags(etag)
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def serve_file(request, field_file, content_type=None, asynchronous=False):
+    """
+    Serve a stored file with HTTP Range support.
+
+    Full responses go through FileResponse on the open handle so the WSGI
+    server can use sendfile; partial ones seek to the requested offset and
+    stream only the requested bytes. With `asynchronous` the body is an
+    async iterator instead, so an ASGI server streams it without holding a
+    thread per listener (it would buffer a FileResponse whole).
+    """
+    storage = field_file.storage
+    name = field_file.name
+    size = field_file.size
+    try:
+        mtime = storage.get_modified_time(name).timestamp()
+    except (NotImplementedError, OSError):
+        mtime = 0
+    etag = make_etag(size, mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if not_modified is not None:
+        not_modified['Accept-Ranges'] = 'bytes'
+        return not_modified
+
+    if content_type is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    byte_range = None
+    if if_range_matches(request, etag, mtime):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    else:
+        handle = storage.open(name, 'rb')
+        if asynchronous:
+            start, end = byte_range or (0, size - 1)
+            handle.seek(start)
+            response = StreamingHttpResponse(
+                aiter_file(handle, end - start + 1), content_type=content_type,
+                status=200 if byte_range is None else 206,
+            )
+            response['Content-Length'] = str(end - start + 1)
+            if byte_range is not None:
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        elif byte_range is None:
+            response = FileResponse(handle, content_type=content_type)
+        else:
+            start, end = byte_range
+            handle.seek(start)
+            length = end - start + 1
+            if end == size - 1:
+                response = FileResponse(handle, content_type=content_type, status=206)
+            else:
+                response = FileResponse(
+                    RangeFile(handle, length), content_type=content_type, status=206
+                )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    return response
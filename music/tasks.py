@@ -0,0 +1,50 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from music_player.routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+                thread_name_prefix='music-worker',
+            )
+        return _executor
+
+
+def _run(fn, args, kwargs):
+    close_old_connections()
+    try:
+        # Tasks follow writes the replicas may not have yet
+        with use_primary():
+            return fn(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', fn.__name__)
+        raise
+    finally:
+        connections.close_all()
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run `fn(*args, **kwargs)` off the request thread once the current
+    transaction commits, so the worker sees the rows the caller just wrote.
+
+    With BACKGROUND_TASKS_EAGER the task runs inline instead (tests, scripts).
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: fn(*args, **kwargs))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run, fn, args, kwargs))
@@ -0,0 +1,28 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from music.thumbnails import srcset, thumbnail_url, widths_for
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(image, width, alt='', sizes=None, **attrs):
+    """
+    Responsive <picture> for a cover or artist image shown `width` CSS
+    pixels wide: a WebP srcset with a JPEG fallback, covering 1x and 2x.
+
+        {% thumbnail song.cover_image 200 alt=song.title class="card-img-top" %}
+    """
+    widths = widths_for(int(width))
+    sizes = sizes or f'{width}px'
+    attrs.setdefault('loading', 'lazy')
+    fallback = next((w for w in widths if w >= int(width)), widths[-1])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+        srcset(image, widths, 'webp'), sizes,
+        thumbnail_url(image, fallback, 'jpeg'), srcset(image, widths, 'jpeg'), sizes,
+        alt, flatatt(attrs),
+    )
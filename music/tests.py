@@ -1,3 +1,785 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import unquote
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+import mutagen.id3
+import mutagen.wave
+from PIL import Image
+
+from music_player.routers import ReplicaRouter, track_writes, use_primary
+
+from . import async_views
+from .autocomplete import AutocompleteIndex
+from .buffers import PlayBuffer
+from .cache import bump_catalogue_version, catalogue_version
+from .db import serialized_write
+from .history import now_playing_for, recent_plays, recent_plays_for
+from .ingest import ingest_song
+from .lyrics import LyricsProvider, get_lyrics
+from .models import (
+    Album, Artist, CachedLyrics, Genre, Playlist, PlaylistSong, RecentPlay, SimilarSong, Song,
+    UserSongInteraction,
+)
+from .playlists import apply_moves, next_order
+from .search import get_search_backend
+from .similarity import compute_neighbours, rebuild_similar_songs, similar_songs_for, similarity_updates
+from .storage import collect_garbage, get_content_storage
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0)
+class AutocompleteTests(TestCase):
+    """A process's index follows changes it didn't see through signals"""
+
+    def setUp(self):
+        cache.clear()
+        self.artist = Artist.objects.create(name='Artist')
+
+    def test_resyncs_when_the_catalogue_version_changes(self):
+        index = AutocompleteIndex()
+        Song.objects.create(title='Crazy in Love', artist=self.artist, audio_file='x.mp3')
+        self.assertEqual([result['label'] for result in index.lookup('cra')], ['Crazy in Love'])
+
+        # Another process imports songs without signals, then bumps the version
+        Song.objects.bulk_create([Song(title='Crazy Train', artist=self.artist, audio_file='y.mp3')])
+        self.assertEqual(len(index.lookup('cra')), 1)
+        bump_catalogue_version()
+        self.assertEqual(sorted(result['label'] for result in index.lookup('cra')),
+                         ['Crazy Train', 'Crazy in Love'])
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0, RECENT_PLAYS_FLUSH_INTERVAL=0)
+class ListViewQueryCountTests(TestCase):
+    """Each list page must run a constant number of queries, however many rows it shows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        cls.genre = Genre.objects.create(name='Rock')
+        cls.artist = Artist.objects.create(name='Artist')
+        cls.playlist = Playlist.objects.create(name='Mix', user=cls.staff, is_public=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def add_songs(self, count):
+        for i in range(count):
+            artist = Artist.objects.create(name=f'Loud {i}')
+            album = Album.objects.create(title=f'Loud album {i}', artist=artist)
+            song = Song.objects.create(title=f'Loud song {i}', artist=artist, album=album, audio_file='x.mp3')
+            song.genre.add(self.genre)
+            self.playlist.songs.add(song)
+            Song.objects.create(title=f'Loud track {i}', artist=self.artist, album=Album.objects.create(
+                title=f'Loud record {i}', artist=self.artist), audio_file='y.mp3')
+
+    def assertConstantQueries(self, url, expected):
+        """Render `url` with few and with many rows; both must run `expected` queries"""
+        for count in (2, 8):
+            self.add_songs(count)
+            cache.clear()
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('music:home'), 8)
+
+    def test_search(self):
+        self.assertConstantQueries(reverse('music:search') + '?q=loud', 7)
+
+    def test_genre(self):
+        self.assertConstantQueries(reverse('music:genre', args=[self.genre.id]), 6)
+
+    def test_artist(self):
+        self.assertConstantQueries(reverse('music:artist', args=[self.artist.id]), 8)
+
+    def test_manage_songs(self):
+        self.assertConstantQueries(reverse('music:manage_songs'), 6)
+
+    def test_playlist_detail(self):
+        self.assertConstantQueries(reverse('music:playlist_detail', args=[self.playlist.id]), 5)
+
+    def test_song_list_api_filters(self):
+        self.add_songs(2)
+        url = reverse('music:song_list_api')
+        response = self.client.get(url, {'genre': self.genre.id, 'order': 'popular'})
+        self.assertEqual(len(response.json()['results']), 2)
+        for params in ({'genre': 'abc'}, {'artist': 'xyz'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+
+
+class FlakyPlayBuffer(PlayBuffer):
+    """A play buffer whose first write fails"""
+
+    failed = False
+
+    def write(self, batch):
+        if not self.failed:
+            self.failed = True
+            raise OperationalError('database is locked')
+        super().write(batch)
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=60, SIMILARITY_FLUSH_INTERVAL=60)
+class PlayBufferTests(TestCase):
+    """A flush that fails keeps its plays, and plays of deleted songs are dropped"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='pw')
+        artist = Artist.objects.create(name='Artist')
+        cls.kept = Song.objects.create(title='Kept', artist=artist, audio_file='x.mp3')
+        cls.deleted = Song.objects.create(title='Deleted', artist=artist, audio_file='y.mp3')
+
+    def setUp(self):
+        # Played songs are queued for a similarity update
+        self.addCleanup(similarity_updates.flush)
+
+    def test_failed_flush_keeps_plays(self):
+        buffer = FlakyPlayBuffer()
+        self.addCleanup(buffer.flush)
+        buffer.record(self.kept.id, self.user.id)
+        with self.assertRaises(OperationalError):
+            buffer.flush()
+        buffer.record(self.kept.id, self.user.id)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.plays_count, 2)
+        self.assertEqual(UserSongInteraction.objects.get(user=self.user, song=self.kept).play_count, 2)
+
+    @override_settings(SIMILARITY_FLUSH_INTERVAL=0)
+    def test_failing_similarity_flush_keeps_plays_written_once(self):
+        buffer = PlayBuffer()
+        buffer.record(self.kept.id, self.user.id)
+        with mock.patch('music.similarity._store_neighbours', side_effect=OperationalError('database is locked')), \
+                mock.patch.object(similarity_updates, 'schedule'):  # no retry timer
+            with self.assertLogs('music.buffers', 'ERROR'):
+                self.assertEqual(buffer.flush(), 1)
+            self.assertEqual(buffer.flush(), 0)
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.plays_count, 1)
+        self.assertIn(self.kept.id, similarity_updates.pending)
+
+    def test_plays_of_deleted_songs_are_dropped(self):
+        buffer = PlayBuffer()
+        self.addCleanup(buffer.flush)
+        buffer.record(self.kept.id, self.user.id)
+        buffer.record(self.deleted.id, self.user.id)
+        self.deleted.delete()
+
+        buffer.flush()
+        self.assertEqual(
+            list(UserSongInteraction.objects.filter(user=self.user).values_list('song_id', flat=True)),
+            [self.kept.id],
+        )
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=60, SIMILARITY_FLUSH_INTERVAL=60)
+class SimilarityTests(TestCase):
+    """Changed songs refresh only the neighbour lists they touch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rock, cls.jazz = Genre.objects.create(name='Rock'), Genre.objects.create(name='Jazz')
+        first, second = Artist.objects.create(name='First'), Artist.objects.create(name='Second')
+        cls.songs = [
+            Song.objects.create(title=f'Song {i}', artist=artist, audio_file=f'{i}.mp3')
+            for i, artist in enumerate([first, first, second, second])
+        ]
+        cls.songs[0].genre.add(cls.rock)
+        cls.songs[2].genre.add(cls.rock)
+        cls.songs[3].genre.add(cls.jazz)
+        cls.lonely = Song.objects.create(title='Lonely', artist=Artist.objects.create(name='Alone'),
+                                         audio_file='lonely.mp3')
+
+    def setUp(self):
+        self.addCleanup(similarity_updates.flush)
+        rebuild_similar_songs()
+
+    def stored(self):
+        neighbours = {}
+        for song_id, similar_id, score in SimilarSong.objects.values_list('song_id', 'similar_id', 'score'):
+            neighbours.setdefault(song_id, {})[similar_id] = round(score, 6)
+        return neighbours
+
+    def test_update_matches_full_rebuild(self):
+        self.songs[1].genre.add(self.jazz)
+        self.songs[2].genre.remove(self.rock)
+        self.assertEqual(rebuild_similar_songs([self.songs[1].id, self.songs[2].id]), 4)
+
+        expected = {
+            song_id: {similar_id: round(score, 6) for similar_id, score in entries}
+            for song_id, entries in compute_neighbours().items() if entries
+        }
+        self.assertEqual(self.stored(), expected)
+
+    def test_songs_without_neighbours_are_not_queued_again(self):
+        self.lonely.refresh_from_db()
+        self.assertTrue(self.lonely.neighbours_computed)
+        similarity_updates.flush()
+
+        self.assertEqual(similar_songs_for(self.lonely), [])
+        self.assertEqual(similarity_updates.size(similarity_updates.pending), 0)
+
+
+def tagged_wav(seconds=2, **tags):
+    """A silent WAV file with ID3 tags (e.g. TIT2='Title'), as bytes"""
+    with tempfile.NamedTemporaryFile(suffix='.wav') as file:
+        with wave.open(file.name, 'wb') as audio:
+            audio.setnchannels(1)
+            audio.setsampwidth(2)
+            audio.setframerate(8000)
+            audio.writeframes(b'\0\0' * 8000 * seconds)
+        tagged = mutagen.wave.WAVE(file.name)
+        tagged.add_tags()
+        for frame, text in tags.items():
+            tagged.tags.add(getattr(mutagen.id3, frame)(encoding=3, text=text))
+        tagged.save()
+        return file.read()
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0)
+class IngestTests(TestCase):
+    """Ingestion writes file metadata back through the model's signals"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.artist = Artist.objects.create(name='Artist')
+
+    def test_metadata_written_back(self):
+        song = Song.objects.create(title='', artist=self.artist, ingest_status='pending', audio_file=ContentFile(
+            tagged_wav(TIT2='Tagged Title', TALB='Tagged Album'), name='tagged.wav'
+        ))
+        version = catalogue_version()
+
+        self.assertEqual(ingest_song(song.id)['title'], 'Tagged Title')
+        song.refresh_from_db()
+        self.assertEqual((song.title, song.album.title), ('Tagged Title', 'Tagged Album'))
+        self.assertEqual((song.duration_seconds, song.ingest_status), (2, 'ready'))
+        self.assertEqual(len(song.content_hash), 64)
+        self.assertEqual(list(get_search_backend().search('tagged')['songs']), [song])
+        self.assertNotEqual(catalogue_version(), version)
+
+    def test_unreadable_file_fails(self):
+        song = Song.objects.create(title='Noise', artist=self.artist, ingest_status='pending',
+                                   audio_file=ContentFile(b'not audio' * 100, name='noise.mp3'))
+        with self.assertLogs('music.ingest', 'WARNING'):
+            self.assertIsNone(ingest_song(song.id))
+        song.refresh_from_db()
+        self.assertEqual(song.ingest_status, 'failed')
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0, CONTENT_GC_GRACE=0)
+class ContentStorageTests(TestCase):
+    """Identical uploads share a file, which goes once nothing references it"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    def setUp(self):
+        self.artist = Artist.objects.create(name='Artist')
+        self.storage = get_content_storage()
+
+    def upload(self, content, title='Song'):
+        return Song.objects.create(title=title, artist=self.artist,
+                                   audio_file=ContentFile(content, name='upload.mp3'))
+
+    def delete(self, song):
+        with self.captureOnCommitCallbacks(execute=True):
+            song.delete()
+
+    def test_identical_uploads_share_a_file(self):
+        first, second = self.upload(b'same' * 100), self.upload(b'same' * 100)
+        other = self.upload(b'other' * 100)
+
+        self.assertEqual(first.audio_file.name, second.audio_file.name)
+        self.assertNotEqual(first.audio_file.name, other.audio_file.name)
+        self.assertTrue(first.audio_file.name.startswith('cas/'))
+
+    def test_release_waits_for_the_last_reference(self):
+        first, second = self.upload(b'same' * 100), self.upload(b'same' * 100)
+        name = first.audio_file.name
+
+        self.delete(first)
+        self.assertTrue(self.storage.exists(name))
+        self.delete(second)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_recently_reused_file_is_kept(self):
+        name = self.storage.save('old.mp3', ContentFile(b'reused' * 100))
+        os.utime(self.storage.path(name), (0, 0))
+
+        with override_settings(CONTENT_GC_GRACE=60):
+            # An upload of the same content whose row isn't committed yet
+            self.assertEqual(self.storage.save('again.mp3', ContentFile(b'reused' * 100)), name)
+            self.assertFalse(self.storage.delete_unreferenced(name, lambda name: 0))
+            self.assertEqual(collect_garbage(), [])
+        self.assertTrue(self.storage.exists(name))
+
+    def test_collect_garbage(self):
+        kept = self.upload(b'kept' * 100)
+        orphan = self.storage.save('orphan.mp3', ContentFile(b'orphan' * 100))
+
+        self.assertEqual(collect_garbage(dry_run=True), [orphan])
+        self.assertTrue(self.storage.exists(orphan))
+        self.assertEqual(collect_garbage(), [orphan])
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(kept.audio_file.name))
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0)
+class ThumbnailTests(TestCase):
+    """Thumbnails are made on first request, and only for visible songs"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    def test_inactive_song_has_no_thumbnail(self):
+        cover = BytesIO()
+        Image.new('RGB', (100, 100), 'red').save(cover, 'PNG')
+        song = Song.objects.create(title='Song', artist=Artist.objects.create(name='Artist'), audio_file='x.mp3',
+                                   cover_image=ContentFile(cover.getvalue(), name='cover.png'))
+        url = reverse('music:thumbnail', args=['song', song.id, 64, 'jpeg'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        Song.objects.filter(pk=song.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0,
+                   RECENT_PLAYS_FLUSH_INTERVAL=60, RECENT_PLAYS_PER_USER=3)
+class RecentPlayHistoryTests(TestCase):
+    """Plays are buffered, cached for reads and trimmed to the last few per user"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='pw')
+        artist = Artist.objects.create(name='Artist')
+        cls.songs = [Song.objects.create(title=f'Song {i}', artist=artist, audio_file='x.mp3') for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+        recent_plays.flush()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        recent_plays.flush()
+
+    def play(self, song):
+        self.client.get(reverse('music:song_detail', args=[song.id]))
+
+    def test_plays_are_written_in_one_flush_and_trimmed(self):
+        for song in self.songs:
+            self.play(song)
+        self.assertFalse(RecentPlay.objects.exists())
+
+        recent_plays.flush()
+        self.assertEqual(
+            list(RecentPlay.objects.values_list('song_id', flat=True)),
+            [song.id for song in reversed(self.songs[2:])],
+        )
+
+    def test_reads_see_buffered_plays_once_cached(self):
+        self.assertEqual(recent_plays_for(self.user), [])
+        self.play(self.songs[0])
+        self.play(self.songs[1])
+        self.play(self.songs[0])
+        self.assertEqual([play.song for play in recent_plays_for(self.user)], [self.songs[0], self.songs[1]])
+        recent_plays.flush()
+        self.assertEqual([play.song for play in recent_plays_for(self.user)], [self.songs[0], self.songs[1]])
+
+    def test_now_playing_is_cached_until_the_next_play(self):
+        self.play(self.songs[0])
+        self.assertEqual(now_playing_for(self.user.pk), self.songs[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(now_playing_for(self.user.pk).artist.name, 'Artist')
+        self.play(self.songs[1])
+        self.assertEqual(now_playing_for(self.user.pk), self.songs[1])
+
+
+@override_settings(SIMILARITY_FLUSH_INTERVAL=60)
+class PlaylistStatsTests(TestCase):
+    """Playlist song_count, total duration and cover follow every membership change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pw')
+        artist = Artist.objects.create(name='Artist')
+        cls.plain = Song.objects.create(title='Plain', artist=artist, audio_file='a.mp3', duration_seconds=61)
+        cls.covered = Song.objects.create(title='Covered', artist=artist, audio_file='b.mp3',
+                                          cover_image='c.jpg', duration_seconds=120)
+        cls.playlist = Playlist.objects.create(name='Mix', user=cls.user)
+
+    def setUp(self):
+        self.addCleanup(similarity_updates.flush)
+
+    def assertStats(self, count, seconds, cover):
+        self.playlist.refresh_from_db()
+        self.assertEqual(
+            (self.playlist.song_count, self.playlist.total_duration_seconds, self.playlist.cover_song),
+            (count, seconds, cover),
+        )
+
+    def test_add_remove_and_delete(self):
+        self.playlist.songs.add(self.plain)
+        self.assertStats(1, 61, None)
+        self.covered.playlist_set.add(self.playlist)
+        self.assertStats(2, 181, self.covered)
+        self.assertEqual(self.playlist.total_duration, '03:01')
+        Playlist.objects.filter(pk=self.playlist.pk).update(total_duration_seconds=3 * 3600 + 5)
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.total_duration, '3:00:05')
+        Playlist.objects.filter(pk=self.playlist.pk).update(total_duration_seconds=181)
+
+        self.playlist.songs.remove(self.covered)
+        self.assertStats(1, 61, None)
+        self.plain.delete()
+        self.assertStats(0, 0, None)
+
+    def test_cover_follows_song_changes(self):
+        self.playlist.songs.add(self.plain, self.covered)
+        self.assertStats(2, 181, self.covered)
+
+        self.covered.is_active = False
+        self.covered.save()
+        self.assertStats(2, 181, None)
+        self.covered.is_active = True
+        self.covered.save(update_fields=['is_active'])
+        self.assertStats(2, 181, self.covered)
+
+        self.plain.cover_image = 'p.jpg'
+        self.plain.save()
+        self.assertStats(2, 181, self.plain)
+        self.covered.delete()
+        self.assertStats(1, 61, self.plain)
+
+    def test_bulk_changes_apply_deltas(self):
+        artist = self.plain.artist
+        songs = [Song.objects.create(title=f'Song {i}', artist=artist, audio_file='x.mp3', duration_seconds=10)
+                 for i in range(20)]
+        with self.assertNumQueries(5):
+            self.playlist.songs.add(*songs)
+        self.assertStats(20, 200, None)
+
+        # Collect and delete the rows, then two small updates per row (stats, cover)
+        with self.assertNumQueries(2 + 2 * 20):
+            self.playlist.songs.clear()
+        self.assertStats(0, 0, None)
+
+        self.playlist.songs.add(*songs)
+        self.playlist.delete()
+        self.assertFalse(Playlist.objects.exists())
+
+
+class PlaylistReorderTests(TestCase):
+    """Moves rewrite only the moved rows until a gap runs out"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pw')
+        artist = Artist.objects.create(name='Artist')
+        cls.playlist = Playlist.objects.create(name='Mix', user=cls.user)
+        cls.songs = []
+        for i in range(6):
+            song = Song.objects.create(title=f'Song {i}', artist=artist, audio_file='x.mp3')
+            cls.playlist.songs.add(song, through_defaults={'order': next_order(cls.playlist)})
+            cls.songs.append(song)
+
+    def order(self):
+        return [self.songs.index(song) for song in self.playlist.ordered_songs()]
+
+    def test_moves_in_one_request(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('music:reorder_playlist', args=[self.playlist.id]),
+            {'moves': [
+                {'songs': [self.songs[4].id, self.songs[5].id], 'before': self.songs[1].id},
+                {'songs': [self.songs[0].id], 'before': None},
+            ]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), [4, 5, 1, 2, 3, 0])
+
+    def test_move_touches_only_moved_rows(self):
+        untouched = dict(PlaylistSong.objects.exclude(song=self.songs[5]).values_list('song_id', 'order'))
+        apply_moves(self.playlist, [{'songs': [self.songs[5].id], 'before': self.songs[0].id}])
+        self.assertEqual(
+            dict(PlaylistSong.objects.exclude(song=self.songs[5]).values_list('song_id', 'order')),
+            untouched,
+        )
+        self.assertEqual(self.order(), [5, 0, 1, 2, 3, 4])
+
+    def test_exhausted_gap_renumbers(self):
+        for _ in range(12):
+            # Keep squeezing song 5 between songs 0 and 1, then 1 back before it
+            apply_moves(self.playlist, [{'songs': [self.songs[5].id], 'before': self.songs[1].id}])
+            apply_moves(self.playlist, [{'songs': [self.songs[1].id], 'before': self.songs[5].id}])
+        self.assertEqual(self.order(), [0, 1, 5, 2, 3, 4])
+        self.assertEqual(len(set(PlaylistSong.objects.values_list('order', flat=True))), 6)
+
+    def test_bad_move_changes_nothing(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('music:reorder_playlist', args=[self.playlist.id]),
+            {'moves': [
+                {'songs': [self.songs[5].id], 'before': self.songs[0].id},
+                {'songs': [self.songs[0].id], 'before': self.songs[0].id},
+            ]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.order(), [0, 1, 2, 3, 4, 5])
+
+
+class SQLiteTuningTests(TestCase):
+    """Connections get the configured PRAGMAs, and locked writes are retried"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    @override_settings(SQLITE_WRITE_RETRIES=2)
+    def test_locked_writes_are_retried_outside_transactions(self):
+        attempts = []
+
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'written'
+
+        # TestCase wraps each test in a transaction; pretend it doesn't
+        connection.in_atomic_block, in_atomic_block = False, connection.in_atomic_block
+        try:
+            with self.assertLogs('music.db', 'WARNING'):
+                self.assertEqual(serialized_write(write), 'written')
+        finally:
+            connection.in_atomic_block = in_atomic_block
+        self.assertEqual(len(attempts), 3)
+
+        attempts.clear()
+        with self.assertRaises(OperationalError):
+            serialized_write(write)
+        self.assertEqual(len(attempts), 1)
+
+
+class ReplicaRoutingTests(TestCase):
+    """Catalogue reads go to replicas unless the request wrote or is pinned"""
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+    def test_router(self):
+        router = ReplicaRouter()
+        # TestCase runs inside a transaction, which pins reads to the primary
+        connection.in_atomic_block, in_atomic_block = False, connection.in_atomic_block
+        try:
+            with track_writes():
+                self.assertIn(router.db_for_read(Song), {'replica1', 'replica2'})
+                self.assertEqual(router.db_for_read(RecentPlay), 'default')
+                with use_primary():
+                    self.assertEqual(router.db_for_read(Song), 'default')
+                self.assertEqual(router.db_for_write(Song), 'default')
+                self.assertEqual(router.db_for_read(Song), 'default')
+        finally:
+            connection.in_atomic_block = in_atomic_block
+
+    @override_settings(DATABASE_REPLICAS=['default'], PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0)
+    def test_writes_pin_the_client(self):
+        user = User.objects.create_user('fan', password='pw')
+        song = Song.objects.create(title='Song', artist=Artist.objects.create(name='Artist'), audio_file='x.mp3')
+        self.client.force_login(user)
+
+        self.assertNotIn('primary_pin', self.client.get(reverse('music:home')).cookies)
+        response = self.client.post(reverse('music:like_song'), {'song_id': song.id, 'action': 'like'},
+                                    content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.cookies['primary_pin']['max-age'], 10)
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0, RECENT_PLAYS_FLUSH_INTERVAL=0)
+class AsyncViewTests(TestCase):
+    """The async views answer like their sync counterparts"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='pw')
+        cls.song = Song.objects.create(title='Song', artist=Artist.objects.create(name='Artist'),
+                                       audio_file=ContentFile(bytes(range(256)) * 40, name='song.mp3'))
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    async def test_stream_ranges(self):
+        request = self.factory.get('/', headers={'Range': 'bytes=100-299'})
+        response = await async_views.stream_song(request, self.song.id)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-299/10240')
+        body = b''.join([chunk async for chunk in response])
+        self.assertEqual(body, (bytes(range(256)) * 40)[100:300])
+
+        response = await async_views.stream_song(self.factory.get('/'), self.song.id)
+        self.assertEqual(len(b''.join([chunk async for chunk in response])), 10240)
+
+    async def test_song_detail_and_like(self):
+        request = self.factory.get('/')
+        request.user = self.user
+        response = await async_views.song_detail(request, self.song.id)
+        self.assertContains(response, 'Song')
+        self.assertEqual(await RecentPlay.objects.filter(user=self.user).acount(), 1)
+
+        request = self.factory.post('/', {'song_id': self.song.id, 'action': 'like'},
+                                    content_type='application/json')
+        request.user = self.user
+        response = await async_views.like_song(request)
+        self.assertEqual(json.loads(response.content), {'success': True, 'likes_count': 1, 'is_liked': True})
+
+
+class StubLyricsHandler(BaseHTTPRequestHandler):
+    """GET /v1/<artist>/<title>: known songs, 404s, a broken artist, a slow and an odd song"""
+
+    lyrics = {('artist', 'song'): 'La la la', ('artist', 'other song'): 'Oh oh'}
+    hits = []
+
+    def do_GET(self):
+        _, _, artist, title = [unquote(part) for part in self.path.split('/')]
+        self.hits.append((artist, title))
+        if title.lower() == 'slow':
+            time.sleep(1)
+            return  # the client has given up by now
+        if title.lower() == 'odd':
+            body = b'["not", "an", "object"]'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if artist.lower() == 'broken':
+            self.send_response(500)
+            self.end_headers()
+            return
+        found = self.lyrics.get((artist.lower(), title.lower()))
+        body = json.dumps({'lyrics': found} if found else {'error': 'No lyrics found'}).encode()
+        self.send_response(200 if found else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LyricsTests(TestCase):
+    """Lyrics come from the provider once, then from the cache, failures trip the breaker"""
+
+    @classmethod
+    def setUpClass(cls):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubLyricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(server.server_close)
+        cls.addClassCleanup(server.shutdown)
+        cls.enterClassContext(override_settings(
+            LYRICS_API_URL=f'http://127.0.0.1:{server.server_port}/v1',
+            LYRICS_TIMEOUT=0.3, LYRICS_BREAKER_FAILURES=2, LYRICS_BREAKER_RESET=60,
+            PLAY_COUNT_FLUSH_INTERVAL=0, SIMILARITY_FLUSH_INTERVAL=0,
+        ))
+        super().setUpClass()
+
+    def setUp(self):
+        StubLyricsHandler.hits.clear()
+
+    def test_found_and_missing_lyrics_are_cached(self):
+        provider = LyricsProvider()
+        for _ in range(2):
+            self.assertEqual(get_lyrics('Artist', '  Song ', provider), 'La la la')
+            self.assertIsNone(get_lyrics('Artist', 'Unknown', provider))
+        self.assertEqual(len(StubLyricsHandler.hits), 2)
+        self.assertEqual(CachedLyrics.objects.get(title_key='unknown').lyrics, '')
+
+        with override_settings(LYRICS_NEGATIVE_TTL=0):
+            get_lyrics('Artist', 'Unknown', provider)
+        self.assertEqual(len(StubLyricsHandler.hits), 3)
+
+    def test_failures_open_the_breaker_and_are_not_cached(self):
+        provider = LyricsProvider()
+        with self.assertLogs('music.lyrics', 'WARNING'):
+            self.assertIsNone(get_lyrics('Broken', 'Song', provider))
+            self.assertIsNone(get_lyrics('Artist', 'Slow', provider))  # read timeout
+            self.assertIsNone(get_lyrics('Artist', 'Song', provider))  # open: not even tried
+        self.assertEqual(StubLyricsHandler.hits, [('Broken', 'Song'), ('Artist', 'Slow')])
+        self.assertFalse(CachedLyrics.objects.exists())
+
+    def test_unexpected_bodies_fail_and_end_the_trial(self):
+        provider = LyricsProvider()
+        provider.breaker.reset_after = 0  # every call after opening is a trial
+        with self.assertLogs('music.lyrics', 'WARNING'):
+            for _ in range(3):
+                self.assertIsNone(get_lyrics('Artist', 'Odd', provider))
+        self.assertTrue(provider.breaker.opened_at)
+        self.assertEqual(get_lyrics('Artist', 'Song', provider), 'La la la')
+        self.assertIsNone(provider.breaker.opened_at)
+
+    def test_backfill(self):
+        artist = Artist.objects.create(name='Artist')
+        songs = [Song.objects.create(title=title, artist=artist, audio_file='x.mp3')
+                 for title in ('Song', 'Other song', 'Unknown')]
+        Song.objects.create(title='Kept', artist=artist, audio_file='x.mp3', lyrics='Mine')
+
+        out = StringIO()
+        call_command('backfill_lyrics', workers=2, stdout=out)
+        self.assertIn('Filled 2 songs, 1 without lyrics, 0 failed', out.getvalue())
+        self.assertEqual(
+            [(song.lyrics, song.lyrics_source) for song in Song.objects.filter(pk__in=[s.pk for s in songs])
+             .order_by('pk')],
+            [('La la la', 'api'), ('Oh oh', 'api'), ('', 'manual')],
+        )
+
+        call_command('backfill_lyrics', stdout=StringIO())
+        self.assertEqual(len(StubLyricsHandler.hits), 3)
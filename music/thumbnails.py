@@ -0,0 +1,158 @@
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Album, Artist, Song
+from .storage import get_content_storage, referenced_names
+
+logger = logging.getLogger(__name__)
+
+# Image fields that get thumbnails, by the name used in thumbnail URLs
+IMAGE_FIELDS = {
+    'song': (Song, 'cover_image'),
+    'album': (Album, 'cover_image'),
+    'artist': (Artist, 'image'),
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+DIRECTORY = 'thumbnails'
+
+
+def thumbnail_widths():
+    return getattr(settings, 'THUMBNAIL_SIZES', [64, 128, 256, 512])
+
+
+def thumbnail_key(name):
+    """
+    Directory key for an image's thumbnails: the content hash for
+    content-addressed files, so duplicates share thumbnails, else a hash of
+    the name.
+    """
+    storage = get_content_storage()
+    if getattr(storage, 'is_content_addressed', lambda n: False)(name):
+        return os.path.splitext(os.path.basename(name))[0]
+    return hashlib.sha1(name.encode()).hexdigest()
+
+
+def thumbnail_name(key, width, fmt):
+    return f'{DIRECTORY}/{key[:2]}/{key}/{width}.{fmt}'
+
+
+def ready_cache_key(key):
+    return f'music:thumbnails:{key}'
+
+
+def is_ready(name):
+    return bool(cache.get(ready_cache_key(thumbnail_key(name))))
+
+
+def generate_thumbnails(field_file):
+    """
+    Write every configured width and format of an image, skipping those that
+    already exist. Images are never upscaled. Returns the number written.
+    """
+    name = field_file.name
+    key = thumbnail_key(name)
+    missing = [
+        (width, fmt) for width in thumbnail_widths() for fmt in FORMATS
+        if not default_storage.exists(thumbnail_name(key, width, fmt))
+    ]
+    written = 0
+    if missing:
+        try:
+            with field_file.open('rb') as source:
+                image = ImageOps.exif_transpose(Image.open(source))
+                image.load()
+        except (OSError, UnidentifiedImageError) as e:
+            logger.warning('Could not read image %s: %s', name, e)
+            return 0
+
+        quality = getattr(settings, 'THUMBNAIL_QUALITY', 80)
+        for width, fmt in missing:
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            if fmt == 'jpeg' and resized.mode != 'RGB':
+                resized = resized.convert('RGB')
+            buffer = io.BytesIO()
+            resized.save(buffer, FORMATS[fmt][0], quality=quality)
+            target = thumbnail_name(key, width, fmt)
+            saved = default_storage.save(target, ContentFile(buffer.getvalue()))
+            if saved != target:
+                # Another worker wrote the same thumbnail meanwhile
+                default_storage.delete(saved)
+            written += 1
+
+    cache.set(ready_cache_key(key), True, timeout=None)
+    return written
+
+
+def generate_for(kind, pk):
+    model, field = IMAGE_FIELDS[kind]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field):
+        return 0
+    return generate_thumbnails(getattr(instance, field))
+
+
+def kind_of(field_file):
+    for kind, (model, field) in IMAGE_FIELDS.items():
+        if isinstance(field_file.instance, model) and field_file.field.name == field:
+            return kind
+    raise ValueError(f'No thumbnails for {field_file.field}')
+
+
+def thumbnail_url(field_file, width, fmt):
+    """
+    URL of one thumbnail: the stored file once it has been generated,
+    otherwise the view that generates it on first request.
+    """
+    if is_ready(field_file.name):
+        return default_storage.url(thumbnail_name(thumbnail_key(field_file.name), width, fmt))
+    return reverse('music:thumbnail', args=[kind_of(field_file), field_file.instance.pk, width, fmt])
+
+
+def srcset(field_file, widths, fmt):
+    return ', '.join(f'{thumbnail_url(field_file, width, fmt)} {width}w' for width in widths)
+
+
+def widths_for(display_width):
+    """Configured widths up to the first one that covers a 2x display"""
+    widths = []
+    for width in sorted(thumbnail_widths()):
+        widths.append(width)
+        if width >= display_width * 2:
+            break
+    return widths
+
+
+def collect_thumbnail_garbage(dry_run=False):
+    """Delete thumbnail directories whose source image no row references"""
+    if not default_storage.exists(DIRECTORY):
+        return []
+    keys = {thumbnail_key(name) for name in referenced_names()}
+    orphans = {}
+    for shard in default_storage.listdir(DIRECTORY)[0]:
+        for key in default_storage.listdir(f'{DIRECTORY}/{shard}')[0]:
+            if key not in keys:
+                orphans[key] = [
+                    f'{DIRECTORY}/{shard}/{key}/{filename}'
+                    for filename in default_storage.listdir(f'{DIRECTORY}/{shard}/{key}')[1]
+                ]
+    if not dry_run:
+        for key, names in orphans.items():
+            cache.delete(ready_cache_key(key))
+            for name in names:
+                default_storage.delete(name)
+    return [name for names in orphans.values() for name in names]
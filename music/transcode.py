@@ -0,0 +1,164 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+
+from .models import Song, SongRendition
+from .storage import release
+from .tasks import submit
+
+logger = logging.getLogger(__name__)
+
+# Output container and ffmpeg encoder arguments per codec
+CODECS = {
+    'opus': {'extension': 'ogg', 'content_type': 'audio/ogg', 'args': ['-c:a', 'libopus']},
+    'aac': {'extension': 'm4a', 'content_type': 'audio/mp4', 'args': ['-c:a', 'aac', '-movflags', '+faststart']},
+}
+
+# Target bitrate (kbps) for each quality a client can ask for
+QUALITY_BITRATES = {
+    'low': 64,
+    'medium': 128,
+    'high': 256,
+}
+
+DEFAULT_RENDITIONS = [('opus', 64), ('opus', 128), ('aac', 128), ('aac', 256)]
+
+
+def rendition_ladder():
+    return getattr(settings, 'AUDIO_RENDITIONS', DEFAULT_RENDITIONS)
+
+
+def ffmpeg_binary():
+    return getattr(settings, 'FFMPEG_BINARY', None) or shutil.which('ffmpeg')
+
+
+@contextmanager
+def local_path(field_file):
+    """A filesystem path for a stored file, downloading it if the storage is remote"""
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        # Outside the try, so errors raised in the caller's block propagate
+        yield path
+        return
+    suffix = os.path.splitext(field_file.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        with field_file.open('rb') as source:
+            shutil.copyfileobj(source, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def transcode(source, destination, codec, bitrate):
+    """Encode `source` to `destination` with a local ffmpeg"""
+    subprocess.run(
+        [
+            ffmpeg_binary(), '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', source, '-vn', '-map_metadata', '-1',
+            *CODECS[codec]['args'], '-b:a', f'{bitrate}k',
+            destination,
+        ],
+        check=True,
+        capture_output=True,
+        timeout=getattr(settings, 'TRANSCODE_TIMEOUT', 600),
+    )
+
+
+def build_renditions(song_id, force=False):
+    """Produce every rendition in the ladder that a song doesn't have yet"""
+    song = Song.objects.get(pk=song_id)
+    if not song.audio_file or not ffmpeg_binary():
+        return 0
+
+    built = 0
+    with local_path(song.audio_file) as source:
+        for codec, bitrate in rendition_ladder():
+            rendition, _ = SongRendition.objects.get_or_create(song=song, codec=codec, bitrate=bitrate)
+            if rendition.status == 'ready' and not force:
+                continue
+            extension = CODECS[codec]['extension']
+            with tempfile.TemporaryDirectory() as workdir:
+                output = os.path.join(workdir, f'{bitrate}k.{extension}')
+                try:
+                    transcode(source, output, codec, bitrate)
+                except (subprocess.SubprocessError, OSError) as e:
+                    logger.warning('Transcoding song %s to %s %sk failed: %s', song_id, codec, bitrate, e)
+                    rendition.status = 'failed'
+                    rendition.save(update_fields=['status'])
+                    continue
+                previous = rendition.audio_file.name
+                with open(output, 'rb') as encoded:
+                    rendition.audio_file.save(f'{codec}-{bitrate}k.{extension}', File(encoded), save=False)
+            rendition.status = 'ready'
+            rendition.save(update_fields=['audio_file', 'status'])
+            if previous != rendition.audio_file.name:
+                release(previous)
+            built += 1
+    return built
+
+
+def enqueue_renditions(song_id):
+    if ffmpeg_binary() and rendition_ladder():
+        submit(build_renditions, song_id)
+
+
+def requested_quality(request):
+    """
+    The quality a client wants: an explicit ?quality= wins, then the
+    Save-Data / ECT / Downlink client hints. None means the original file.
+    """
+    quality = request.GET.get('quality')
+    if quality in QUALITY_BITRATES or quality == 'original':
+        return None if quality == 'original' else quality
+
+    if request.headers.get('Save-Data', '').lower() == 'on':
+        return 'low'
+    ect = request.headers.get('ECT')
+    if ect in ('slow-2g', '2g'):
+        return 'low'
+    if ect == '3g':
+        return 'medium'
+    try:
+        downlink = float(request.headers['Downlink'])
+    except (KeyError, ValueError):
+        return None
+    if downlink < 0.5:
+        return 'low'
+    if downlink < 2:
+        return 'medium'
+    return 'high'
+
+
+def requested_codecs(request):
+    """The codecs a client can play, from ?codecs=opus,aac (AAC by default)"""
+    codecs = [codec for codec in request.GET.get('codecs', 'aac').split(',') if codec in CODECS]
+    return codecs or ['aac']
+
+
+def pick_rendition(song, quality, codecs=('aac',)):
+    """
+    Best ready rendition for `quality` in one of the client's `codecs`:
+    the highest bitrate not above the target, else the lowest there is.
+    """
+    if quality is None:
+        return None
+    target = QUALITY_BITRATES[quality]
+    renditions = [
+        rendition for rendition in song.renditions.filter(status='ready', codec__in=codecs)
+        if rendition.audio_file
+    ]
+    if not renditions:
+        return None
+    # Prefer the client's codec order at equal bitrate
+    preference = {codec: i for i, codec in enumerate(codecs)}
+    renditions.sort(key=lambda rendition: (rendition.bitrate, -preference[rendition.codec]))
+    fitting = [rendition for rendition in renditions if rendition.bitrate <= target]
+    return fitting[-1] if fitting else renditions[0]
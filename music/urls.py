@@ -3,21 +3,32 @@ from . import views
 
 app_name = 'music'
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'music'
 
+# The I/O-bound views, async under the ASGI profile
+io_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.home, name='home'),
-    path('song/<int:song_id>/', views.song_detail, name='song_detail'),
+    path('song/<int:song_id>/', io_views.song_detail, name='song_detail'),
+    path('song/<int:song_id>/stream/', io_views.stream_song, name='stream_song'),
+    path('song/<int:song_id>/waveform/', views.song_waveform, name='song_waveform'),
     path('song/<int:song_id>/add-to-playlist/', views.add_to_playlist, name='add_to_playlist'),
     path('playlist/create/', views.create_playlist, name='create_playlist'),
     path('playlist/<int:playlist_id>/', views.playlist_detail, name='playlist_detail'),
     path('playlist/<int:playlist_id>/delete/', views.delete_playlist, name='delete_playlist'),
     path('playlist/<int:playlist_id>/remove/', views.remove_from_playlist, name='remove_from_playlist'),
-    path('search/', views.search, name='search'),
-    path('like-song/', views.like_song, name='like_song'),
+    path('playlist/<int:playlist_id>/reorder/', views.reorder_playlist, name='reorder_playlist'),
+    path('thumbnail/<str:kind>/<int:pk>/<int:width>.<str:fmt>', views.thumbnail, name='thumbnail'),
+    path('search/', io_views.search, name='search'),
+    path('api/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('api/songs/', views.song_list_api, name='song_list_api'),
+    path('like-song/', io_views.like_song, name='like_song'),
+    path('like-songs/', views.like_songs, name='like_songs'),
     path('genre/<int:genre_id>/', views.genre_view, name='genre'),
     path('artist/<int:artist_id>/', views.artist_view, name='artist'),
     
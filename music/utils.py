@@ -1,5 +1,5 @@
 
-import requests
+import hashlib
 import random
 import re
 
@@ -57,42 +57,87 @@ You've made me whole
     
     @staticmethod
     def fetch_from_api(song_title, artist_name):
-        """Fetch lyrics from a real API"""
-        
-        # Example using Lyrics.ovh API (free, no API key required)
-        try:
-            response = requests.get(
-                f"https://api.lyrics.ovh/v1/{artist_name}/{song_title}"
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('lyrics', '')
-            else:
-                return None
-        except:
-            return None
+        """Fetch lyrics from the lyrics API (cached; None when there are none)"""
+        from .lyrics import get_lyrics
+
+        return get_lyrics(artist_name, song_title)
+
+ID3_FRAMES = {'title': 'TIT2', 'artist': 'TPE1', 'album': 'TALB', 'genre': 'TCON'}
+
+
+class MetadataError(Exception):
+    """Raised when an audio file's tags or stream info can't be read"""
+
+
+def format_duration(seconds):
+    """Format a length in seconds as MM:SS, or H:MM:SS from one hour on"""
+    seconds = int(round(seconds or 0))
+    hours, seconds = divmod(seconds, 3600)
+    if hours:
+        return f'{hours}:{seconds // 60:02d}:{seconds % 60:02d}'
+    return f'{seconds // 60:02d}:{seconds % 60:02d}'
+
 
 def extract_metadata(file_path):
-    """Extract metadata from audio file using mutagen"""
+    """
+    Extract tags and duration from an audio file using mutagen.
+
+    `file_path` may be a path or an open binary file. mutagen picks the
+    format (MP3, FLAC, OGG Vorbis/Opus, M4A/AAC, ...) from the content.
+    Raises MetadataError when the file isn't a readable audio file.
+    """
+    import mutagen
+    
     try:
-        from mutagen.mp3 import MP3
-        from mutagen.flac import FLAC
-        from mutagen.easyid3 import EasyID3
-        
-        audio = MP3(file_path, ID3=EasyID3)
-        
-        metadata = {
-            'title': audio.get('title', [''])[0],
-            'artist': audio.get('artist', [''])[0],
-            'album': audio.get('album', [''])[0],
-            'duration': str(int(audio.info.length // 60)).zfill(2) + ':' + 
-                       str(int(audio.info.length % 60)).zfill(2)
-        }
-        return metadata
-    except:
-        return {
-            'title': '',
-            'artist': '',
-            'album': '',
-            'duration': '00:00'
-        }
\ No newline at end of file
+        audio = mutagen.File(file_path, easy=True)
+    except mutagen.MutagenError as e:
+        raise MetadataError(str(e)) from e
+    if audio is None or audio.info is None:
+        raise MetadataError(f'Unrecognized audio format: {file_path}')
+    
+    tags = audio.tags or {}
+    
+    def first(key):
+        # Formats without an "easy" wrapper (e.g. WAV) expose raw ID3 frames
+        values = tags.get(key) or tags.get(ID3_FRAMES[key]) or ['']
+        if hasattr(values, 'text'):
+            values = values.text or ['']
+        return str(values[0]).strip()
+    
+    length = getattr(audio.info, 'length', 0) or 0
+    return {
+        'title': first('title'),
+        'artist': first('artist'),
+        'album': first('album'),
+        'genre': first('genre'),
+        'length': length,
+        'duration': format_duration(length),
+    }
+
+
+def file_hash(file, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of an open binary file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+AUDIO_EXTENSIONS = {'.mp3', '.flac', '.ogg', '.oga', '.opus', '.m4a', '.mp4', '.aac', '.wav'}
+
+
+def scan_audio_file(path):
+    """
+    Tags, duration and content hash of one file, for bulk imports.
+
+    Safe to run in a worker process: returns a plain dict (with an 'error'
+    key instead of raising) and needs no Django setup.
+    """
+    try:
+        metadata = extract_metadata(path)
+        with open(path, 'rb') as audio:
+            metadata['content_hash'] = file_hash(audio)
+    except (MetadataError, OSError) as e:
+        return {'path': path, 'error': str(e)}
+    metadata['path'] = path
+    return metadata
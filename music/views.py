@@ -5,33 +5,70 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.db.models import Count
+from django.http import JsonResponse, Http404
+from django.core.paginator import Paginator
+from django.urls import reverse
 from django.views.decorators.http import require_POST
-from .models import Song, Playlist, Artist, Album, Genre, UserSongInteraction, RecentPlay
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.core.files.storage import default_storage
+from .models import Song, Playlist, Artist, Album, Genre, UserSongInteraction
 from .utils import LyricsGenerator
+from .streaming import serve_file
+from .buffers import play_buffer
+from .history import recent_plays
+from .likes import apply_likes, parse_action
+from .playlists import InvalidMove, apply_moves, next_order
+from .search import get_search_backend
+from .autocomplete import autocomplete_index
+from .similarity import similar_songs_for
+from .recommendations import recommended_songs_for
+from .cache import cache_timeout, catalogue_version, lazy_block
+from .ingest import enqueue_ingest
+from .transcode import CODECS, pick_rendition, requested_codecs, requested_quality
+from .thumbnails import FORMATS, IMAGE_FIELDS, generate_thumbnails, thumbnail_key, thumbnail_name, thumbnail_widths
+from .waveform import WAVEFORM_MAX_AGE
+from .pagination import SONG_ORDERINGS, SONGS_PER_PAGE, InvalidCursor, KeysetPaginator, per_page_from
 import json
 
 def home(request):
     """Home page with featured songs and recommendations"""
     
+    # Catalogue blocks are cached per catalogue version and only computed
+    # when their template fragment isn't cached either
+    version = catalogue_version()
+    
     # Get recent songs
-    recent_songs = Song.objects.filter(is_active=True).order_by('-uploaded_at')[:10]
+    recent_songs = lazy_block('recent_songs', lambda: list(
+        Song.objects.filter(is_active=True).for_listing().order_by('-uploaded_at')[:10]
+    ), version)
     
     # Get popular songs
-    popular_songs = Song.objects.filter(is_active=True).order_by('-plays_count')[:10]
+    popular_songs = lazy_block('popular_songs', lambda: list(
+        Song.objects.filter(is_active=True).for_listing().order_by('-plays_count')[:10]
+    ), version)
     
     # Get featured artists
-    featured_artists = Artist.objects.all()[:6]
+    featured_artists = lazy_block('featured_artists', lambda: list(Artist.objects.all()[:6]), version)
     
     # Get genres
-    genres = Genre.objects.annotate(song_count=Count('song')).filter(song_count__gt=0)[:8]
+    genres = lazy_block('genres', lambda: list(
+        Genre.objects.annotate(song_count=Count('song')).filter(song_count__gt=0)[:8]
+    ), version)
+    
+    # Get personalized recommendations (built offline by build_recommendations)
+    recommended_songs = []
+    if request.user.is_authenticated:
+        recommended_songs = recommended_songs_for(request.user)
     
     context = {
         'recent_songs': recent_songs,
         'popular_songs': popular_songs,
         'featured_artists': featured_artists,
         'genres': genres,
+        'recommended_songs': recommended_songs,
+        'catalogue_version': version,
+        'catalogue_cache_timeout': cache_timeout(),
     }
     
     return render(request, 'music/home.html', context)
@@ -40,36 +77,77 @@ def song_detail(request, song_id):
     """Display song details with lyrics"""
     song = get_object_or_404(Song, id=song_id, is_active=True)
     
-    # Log the play if user is logged in
+    # Log the play; counters are flushed in batches by the play buffer
+    play_buffer.record(song.id, request.user.id if request.user.is_authenticated else None)
+    
+    is_liked = False
     if request.user.is_authenticated:
-        # Update or create interaction
-        interaction, created = UserSongInteraction.objects.get_or_create(
-            user=request.user,
-            song=song,
-            defaults={'play_count': 1}
-        )
-        if not created:
-            interaction.play_count += 1
-            interaction.save()
-        
-        # Add to recent plays
-        RecentPlay.objects.update_or_create(
-            user=request.user,
-            song=song,
-            defaults={'played_at': song.uploaded_at}
-        )
+        recent_plays.record(request.user.id, song.id)
+        is_liked = UserSongInteraction.objects.filter(user=request.user, song=song, is_liked=True).exists()
     
-    # Get similar songs
-    similar_songs = Song.objects.filter(
-        Q(artist=song.artist) | Q(genre__in=song.genre.all())
-    ).exclude(id=song.id).distinct()[:5]
+    # Get similar songs (precomputed by the similarity engine)
+    similar_songs = similar_songs_for(song, limit=5)
     
     context = {
         'song': song,
         'similar_songs': similar_songs,
+        'is_liked': is_liked,
     }
     return render(request, 'music/song_detail.html', context)
 
+def stream_song(request, song_id):
+    """
+    Stream a song's audio file with HTTP Range support for seeking.
+
+    `?quality=low|medium|high` (or the Save-Data / ECT / Downlink client
+    hints) picks a transcoded rendition in one of `?codecs=opus,aac`;
+    without one, or before renditions exist, the original is served.
+    """
+    song = get_object_or_404(Song, id=song_id, is_active=True)
+    if not song.audio_file:
+        raise Http404('Song has no audio file')
+
+    rendition = pick_rendition(song, requested_quality(request), requested_codecs(request))
+    return audio_response(request, song, rendition)
+
+def audio_response(request, song, rendition, asynchronous=False):
+    """Serve `rendition`, or the original file when it's None"""
+    if rendition is None:
+        response = serve_file(request, song.audio_file, asynchronous=asynchronous)
+    else:
+        response = serve_file(request, rendition.audio_file, CODECS[rendition.codec]['content_type'],
+                              asynchronous=asynchronous)
+    patch_vary_headers(response, ['Save-Data', 'ECT', 'Downlink'])
+    response['Accept-CH'] = 'Save-Data, ECT, Downlink'
+    return response
+
+def song_waveform(request, song_id):
+    """A song's precomputed int8 peaks, for drawing the player's waveform"""
+    song = get_object_or_404(Song, id=song_id, is_active=True)
+    if not song.waveform:
+        raise Http404('Waveform not computed yet')
+    response = serve_file(request, song.waveform, 'application/octet-stream')
+    patch_cache_control(response, public=True, max_age=WAVEFORM_MAX_AGE)
+    return response
+
+def thumbnail(request, kind, pk, width, fmt):
+    """Generate an image's thumbnails on first request, then redirect to the stored file"""
+    if kind not in IMAGE_FIELDS or fmt not in FORMATS or width not in thumbnail_widths():
+        raise Http404('Unknown thumbnail')
+    model, field = IMAGE_FIELDS[kind]
+    objects = model.objects.all()
+    if model is Song:
+        # Like the song page and stream: hidden songs don't exist publicly
+        objects = objects.filter(is_active=True)
+    image = getattr(get_object_or_404(objects, pk=pk), field)
+    if not image:
+        raise Http404('No image')
+    generate_thumbnails(image)
+    name = thumbnail_name(thumbnail_key(image.name), width, fmt)
+    if not default_storage.exists(name):
+        raise Http404('Image could not be read')
+    return redirect(default_storage.url(name))
+
 @login_required
 def add_to_playlist(request, song_id):
     """Add a song to a playlist"""
@@ -81,7 +159,7 @@ def add_to_playlist(request, song_id):
         
         # Check if song is already in playlist
         if not playlist.songs.filter(id=song.id).exists():
-            playlist.songs.add(song)
+            playlist.songs.add(song, through_defaults={'order': next_order(playlist)})
             messages.success(request, f'Song added to {playlist.name}')
         else:
             messages.info(request, 'Song already in playlist')
@@ -108,35 +186,30 @@ def create_playlist(request):
 @login_required
 def playlist_detail(request, playlist_id):
     """View a playlist"""
-    playlist = get_object_or_404(Playlist, id=playlist_id)
+    playlist = get_object_or_404(Playlist.objects.select_related('user', 'cover_song'), id=playlist_id)
     
     # Check if user has permission to view
     if not playlist.is_public and playlist.user != request.user:
         messages.error(request, 'You do not have permission to view this playlist')
         return redirect('music:home')
     
-    return render(request, 'music/playlist_detail.html', {'playlist': playlist})
+    context = {
+        'playlist': playlist,
+        'songs': list(playlist.ordered_songs()),
+    }
+    return render(request, 'music/playlist_detail.html', context)
 
 def search(request):
     """Search for songs, artists, and albums"""
     query = request.GET.get('q', '')
     
     if query:
-        songs = Song.objects.filter(
-            Q(title__icontains=query) | 
-            Q(artist__name__icontains=query) |
-            Q(album__title__icontains=query),
-            is_active=True
-        ).distinct()
-        
-        artists = Artist.objects.filter(name__icontains=query)
-        albums = Album.objects.filter(title__icontains=query)
-        
+        results = get_search_backend().search(query, page=request.GET.get('page'))
         context = {
             'query': query,
-            'songs': songs,
-            'artists': artists,
-            'albums': albums,
+            'songs': results['songs'],
+            'artists': results['artists'],
+            'albums': results['albums'],
         }
     else:
         context = {
@@ -148,35 +221,106 @@ def search(request):
     
     return render(request, 'music/search.html', context)
 
+def autocomplete(request):
+    """JSON typeahead suggestions served from the in-memory prefix index"""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(int(request.GET.get('limit', 10)), 50)
+    except ValueError:
+        limit = 10
+    
+    return JsonResponse({
+        'query': query,
+        'results': autocomplete_index.lookup(query, limit),
+    })
+
+def serialize_song(song):
+    """JSON representation of a song, in the shape static/player.js expects"""
+    return {
+        'id': song.id,
+        'title': song.title,
+        'artist': song.artist.name,
+        'album': song.album.title if song.album else None,
+        'duration': song.duration,
+        'duration_seconds': song.duration_seconds,
+        'plays_count': song.plays_count,
+        'likes_count': song.likes_count,
+        'audio_url': song.get_audio_url(),
+        'cover': song.cover_image.url if song.cover_image else None,
+        'waveform_url': reverse('music:song_waveform', args=[song.id]) if song.waveform else None,
+        'url': reverse('music:song_detail', args=[song.id]),
+    }
+
+def song_list_api(request):
+    """JSON song listing with keyset pagination (?order=recent|popular&cursor=)"""
+    order = request.GET.get('order', 'recent')
+    if order not in SONG_ORDERINGS:
+        return JsonResponse({'error': f'Unknown order: {order}'}, status=400)
+    
+    songs = Song.objects.filter(is_active=True).for_listing()
+    for field in ('genre', 'artist'):
+        if request.GET.get(field):
+            try:
+                songs = songs.filter(**{field: int(request.GET[field])})
+            except ValueError:
+                return JsonResponse({'error': f'Invalid {field}: {request.GET[field]}'}, status=400)
+    
+    paginator = KeysetPaginator(songs, SONG_ORDERINGS[order], per_page_from(request))
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    next_url = None
+    if page.has_next():
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    
+    return JsonResponse({
+        'results': [serialize_song(song) for song in page],
+        'next': next_url,
+    })
+
 @login_required
 @require_POST
 def like_song(request):
     """AJAX view to like/unlike a song"""
     try:
         data = json.loads(request.body)
-        song_id = data.get('song_id')
-        action = data.get('action')  # 'like' or 'unlike'
+        song_id = int(data.get('song_id'))
+        liked = parse_action(data.get('action'))  # 'like' or 'unlike'
         
-        song = get_object_or_404(Song, id=song_id)
-        interaction, created = UserSongInteraction.objects.get_or_create(
-            user=request.user,
-            song=song
-        )
+        get_object_or_404(Song, id=song_id)
+        result = apply_likes(request.user, {song_id: liked})[song_id]
         
-        if action == 'like':
-            interaction.is_liked = True
-            song.likes_count += 1
-        elif action == 'unlike':
-            interaction.is_liked = False
-            song.likes_count -= 1
+        return JsonResponse({
+            'success': True,
+            'likes_count': result['likes_count'],
+            'is_liked': result['is_liked']
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@login_required
+@require_POST
+def like_songs(request):
+    """AJAX view to apply many like/unlike toggles at once (offline sync)"""
+    try:
+        data = json.loads(request.body)
         
-        interaction.save()
-        song.save()
+        # Later toggles for the same song win, matching the order they were made
+        actions = {}
+        for toggle in data.get('toggles', []):
+            actions[int(toggle['song_id'])] = parse_action(toggle.get('action'))
+        
+        results = apply_likes(request.user, actions)
         
         return JsonResponse({
             'success': True,
-            'likes_count': song.likes_count,
-            'is_liked': interaction.is_liked
+            'results': [
+                {'song_id': song_id, **result} for song_id, result in results.items()
+            ]
         })
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
@@ -223,15 +367,15 @@ def add_song(request):
             song.lyrics = lyrics
             song.lyrics_source = 'manual'
         
-        # Set duration (you might want to extract from audio file)
-        song.duration = "03:30"  # Placeholder
-        
         # Add genres
         genre_ids = request.POST.getlist('genres')
         song.genre.set(genre_ids)
         
         song.save()
         
+        # Duration, tags and content hash are extracted in the background
+        enqueue_ingest(song)
+        
         messages.success(request, f'Song "{title}" added successfully!')
         return redirect('music:song_detail', song_id=song.id)
     
@@ -249,13 +393,29 @@ def add_song(request):
 @staff_member_required
 def manage_songs(request):
     """Admin view to manage songs"""
-    songs = Song.objects.all().order_by('-uploaded_at')
-    return render(request, 'music/manage_songs.html', {'songs': songs})
+    order = request.GET.get('order', 'recent')
+    if order not in SONG_ORDERINGS:
+        order = 'recent'
+    
+    # Keyset pagination keeps deep pages as cheap as the first one
+    paginator = KeysetPaginator(Song.objects.for_listing().with_genres(), SONG_ORDERINGS[order])
+    try:
+        songs = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        songs = paginator.page()
+    
+    context = {
+        'songs': songs,
+        'order': order,
+        'genres': Genre.objects.all(),
+    }
+    return render(request, 'music/manage_songs.html', context)
 
 def genre_view(request, genre_id):
     """View songs by genre"""
     genre = get_object_or_404(Genre, id=genre_id)
-    songs = Song.objects.filter(genre=genre, is_active=True)
+    songs = Song.objects.filter(genre=genre, is_active=True).for_listing().order_by('-uploaded_at', '-id')
+    songs = Paginator(songs, SONGS_PER_PAGE).get_page(request.GET.get('page'))
     
     context = {
         'genre': genre,
@@ -266,8 +426,9 @@ def genre_view(request, genre_id):
 def artist_view(request, artist_id):
     """View artist details and their songs"""
     artist = get_object_or_404(Artist, id=artist_id)
-    songs = Song.objects.filter(artist=artist, is_active=True)
-    albums = Album.objects.filter(artist=artist)
+    songs = Song.objects.filter(artist=artist, is_active=True).select_related('album').order_by('-plays_count', '-id')
+    songs = Paginator(songs, SONGS_PER_PAGE).get_page(request.GET.get('page'))
+    albums = Album.objects.filter(artist=artist).annotate(song_count=Count('songs'))
     
     context = {
         'artist': artist,
@@ -299,6 +460,21 @@ def remove_from_playlist(request, playlist_id):
     
     return redirect('music:playlist_detail', playlist_id=playlist_id)
 
+@login_required
+@require_POST
+def reorder_playlist(request, playlist_id):
+    """
+    AJAX view to move songs within a playlist. Body:
+    {"moves": [{"songs": [song ids], "before": song id or null for the end}]}
+    """
+    playlist = get_object_or_404(Playlist, id=playlist_id, user=request.user)
+    try:
+        data = json.loads(request.body)
+        apply_moves(playlist, data.get('moves', []))
+    except (InvalidMove, ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True})
+
 @staff_member_required
 def delete_song(request, song_id):
     """Delete a song (admin only)"""
@@ -0,0 +1,90 @@
+import logging
+import subprocess
+import wave
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .models import Song
+from .storage import release
+from .tasks import submit
+from .transcode import ffmpeg_binary, local_path
+
+logger = logging.getLogger(__name__)
+
+# Mono sample rate the audio is decoded at; plenty for a few thousand buckets
+DECODE_RATE = 8000
+
+# Peaks only change if a song is re-decoded; the ETag covers that case
+WAVEFORM_MAX_AGE = 24 * 60 * 60
+
+
+def waveform_buckets():
+    return getattr(settings, 'WAVEFORM_BUCKETS', 2000)
+
+
+def decode(path):
+    """Mono 16-bit samples of an audio file, via ffmpeg or, for WAV, the stdlib"""
+    binary = ffmpeg_binary()
+    if binary:
+        result = subprocess.run(
+            [
+                binary, '-nostdin', '-hide_banner', '-loglevel', 'error',
+                '-i', path, '-vn', '-ac', '1', '-ar', str(DECODE_RATE),
+                '-f', 's16le', '-',
+            ],
+            check=True,
+            capture_output=True,
+            timeout=getattr(settings, 'TRANSCODE_TIMEOUT', 600),
+        )
+        return np.frombuffer(result.stdout, dtype='<i2')
+
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise wave.Error('only 16-bit WAV can be read without ffmpeg')
+        frames = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+        # int32 first: abs(-32768) doesn't fit in int16 and wraps to itself
+        return np.abs(frames.reshape(-1, wav.getnchannels()).astype(np.int32)).max(axis=1)
+
+
+def compute_peaks(samples, buckets):
+    """
+    Downsample to `buckets` absolute peaks scaled to 0..127, as int8 bytes.
+    Tracks shorter than `buckets` samples get one bucket per sample.
+    """
+    samples = np.abs(samples.astype(np.int32))
+    if not len(samples):
+        return b''
+    buckets = min(buckets, len(samples))
+    edges = np.linspace(0, len(samples), buckets + 1).astype(np.int64)[:-1]
+    peaks = np.maximum.reduceat(samples, edges)
+    loudest = peaks.max()
+    if loudest:
+        peaks = np.rint(peaks * (127 / loudest))
+    return peaks.astype(np.int8).tobytes()
+
+
+def build_waveform(song_id, force=False):
+    """Decode a song once and store its peaks next to it; returns the bucket count"""
+    song = Song.objects.get(pk=song_id)
+    if not song.audio_file or (song.waveform and not force):
+        return None
+    try:
+        with local_path(song.audio_file) as path:
+            peaks = compute_peaks(decode(path), waveform_buckets())
+    except (subprocess.SubprocessError, wave.Error, EOFError, OSError) as e:
+        logger.warning('Could not compute the waveform of song %s: %s', song_id, e)
+        return None
+
+    previous = song.waveform.name
+    song.waveform.save('peaks.bin', ContentFile(peaks), save=False)
+    # update() writes just this column and skips the catalogue signals
+    Song.objects.filter(pk=song_id).update(waveform=song.waveform.name)
+    if previous and previous != song.waveform.name:
+        release(previous)
+    return len(peaks)
+
+
+def enqueue_waveform(song_id):
+    submit(build_waveform, song_id)
@@ -3,6 +3,17 @@ ASGI config for music_player project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving through this module switches on the async song page, stream, search
+and like views (ASYNC_VIEWS), so one process can hold thousands of
+listeners streaming audio. Run it with any ASGI server, e.g.:
+
+    uvicorn music_player.asgi:application --workers 4
+    gunicorn music_player.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+Sync parts (ORM calls, template rendering) still run in a thread per
+request, but only briefly; audio chunks are read on the event loop's
+default executor. Set ASYNC_VIEWS=0 to serve the sync views under ASGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +23,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'music_player.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
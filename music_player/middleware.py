@@ -0,0 +1,54 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .routers import replicas, track_writes, use_primary
+
+
+class PrimaryPinMiddleware:
+    """
+    Read-your-writes for clients of a replicated database: a request that
+    writes sets a short-lived cookie, and the client's requests carrying it
+    read from the primary until the replicas have caught up.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replicas():
+            return self.get_response(request)
+
+        with track_writes() as wrote:
+            if settings.PRIMARY_PIN_COOKIE in request.COOKIES:
+                with use_primary():
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+            return self.pin(response, wrote())
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+
+        with track_writes() as wrote:
+            if settings.PRIMARY_PIN_COOKIE in request.COOKIES:
+                with use_primary():
+                    response = await self.get_response(request)
+            else:
+                response = await self.get_response(request)
+            return self.pin(response, wrote())
+
+    def pin(self, response, wrote):
+        if wrote:
+            response.set_cookie(
+                settings.PRIMARY_PIN_COOKIE, '1', max_age=settings.PRIMARY_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,71 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary (`default`). Reads of catalogue models go to
+one of DATABASE_REPLICAS, unless the current request or thread is pinned to
+the primary: after it wrote anything, inside a transaction on the primary,
+or for a few seconds after the same client's last write (see
+PrimaryPinMiddleware), so users read their own writes despite replica lag.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models whose reads may lag behind: the catalogue, shown to every visitor
+CATALOGUE_MODELS = {
+    'music.artist', 'music.album', 'music.genre', 'music.song', 'music.songrendition',
+    'music.similarsong',
+}
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pinned_to_primary():
+    return _pinned.get() or _wrote.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+@contextmanager
+def use_primary():
+    """Send every read in the block to the primary"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def track_writes():
+    """Scope for write tracking (a request); yields a callable telling whether it wrote"""
+    token = _wrote.set(False)
+    try:
+        yield _wrote.get
+    finally:
+        _wrote.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or model._meta.label_lower not in CATALOGUE_MODELS or pinned_to_primary():
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'music_player.middleware.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,12 +70,18 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'music.context_processors.now_playing',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'music_player.wsgi.application'
+ASGI_APPLICATION = 'music_player.asgi.application'
+
+# Serve song pages, streams, search and likes from async views; asgi.py
+# turns this on, sync (WSGI) deployments keep the sync views
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
 
 
 # Database
@@ -84,9 +91,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests instead of reconnecting
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas: SQLite files listed in DATABASE_REPLICAS (separated like PATH)
+# serve catalogue reads; everything else, and all writes, use 'default'
+DATABASE_REPLICAS = []
+for i, path in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(os.pathsep)), start=1):
+    DATABASES[f'replica{i}'] = {**DATABASES['default'], 'NAME': path, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{i}')
+DATABASE_ROUTERS = ['music_player.routers.ReplicaRouter']
+
+# After a write, the client reads from the primary for this long (seconds),
+# so it sees its own changes while the replicas catch up
+PRIMARY_PIN_COOKIE = 'primary_pin'
+PRIMARY_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -134,4 +157,70 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = 'music:home'
 LOGIN_URL = 'accounts:login'
-LOGOUT_REDIRECT_URL = 'accounts:login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'accounts:login'
+
+# Play counting: plays are buffered in process and flushed in batches
+PLAY_COUNT_FLUSH_INTERVAL = 5  # seconds; 0 writes every play immediately
+PLAY_COUNT_MAX_PENDING = 500
+
+# Catalogue search; the FTS5 backend falls back to plain lookups off SQLite
+SEARCH_BACKEND = 'music.search.SQLiteFTSSearchBackend'
+
+# Similar songs: stale neighbour lists are recomputed in batches
+SIMILARITY_FLUSH_INTERVAL = 60  # seconds
+SIMILARITY_MAX_PENDING = 1000
+
+# Caching: local memory needs no external service; with several worker
+# processes use FileBasedCache so invalidations are shared between them
+# Use a shared backend (Redis, Memcached) when serving from several processes:
+# the catalogue version that invalidates cached blocks and resyncs each
+# process's autocomplete index lives here
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'music-player',
+    }
+}
+
+# Lifetime of cached catalogue blocks and template fragments, in seconds
+CATALOGUE_CACHE_TIMEOUT = 300
+
+# Background work (audio ingestion etc.) runs on an in-process thread pool
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False  # run tasks inline, e.g. in tests
+
+# Transcoded renditions, built with a local ffmpeg when one is installed
+FFMPEG_BINARY = None  # None looks ffmpeg up on PATH
+AUDIO_RENDITIONS = [('opus', 64), ('opus', 128), ('aac', 128), ('aac', 256)]  # (codec, kbps)
+TRANSCODE_TIMEOUT = 600  # seconds per rendition
+
+# Catalogue files are stored once per distinct content, keyed by SHA-256
+CONTENT_STORAGE = 'music.storage.ContentAddressedStorage'
+CONTENT_GC_GRACE = 3600  # seconds a written or reused file is safe from collection
+
+# Cover and artist thumbnails: widths in pixels, each written as WebP and JPEG
+THUMBNAIL_SIZES = [64, 128, 256, 512]
+THUMBNAIL_QUALITY = 80
+
+# Waveform peaks drawn in the player's progress bar (one byte per bucket)
+WAVEFORM_BUCKETS = 2000
+
+# Listening history: plays are buffered, and each user keeps the last N
+RECENT_PLAYS_FLUSH_INTERVAL = 5  # seconds
+RECENT_PLAYS_MAX_PENDING = 500
+RECENT_PLAYS_PER_USER = 50
+
+# SQLite tuning: music.db.DEFAULT_SQLITE_PRAGMAS are applied to every new
+# connection unless SQLITE_PRAGMAS is set. WAL mode is kept in the database
+# file itself, so deployments switch it on once with `manage.py enable_wal`
+SQLITE_WRITE_RETRIES = 5  # retries of a write that finds the database locked
+
+# Lyrics API (lyrics.ovh style: <url>/<artist>/<title>); answers are cached
+# in the database, "no lyrics" ones for LYRICS_NEGATIVE_TTL seconds
+LYRICS_API_URL = 'https://api.lyrics.ovh/v1'
+LYRICS_TIMEOUT = (3.05, 10)  # connect, read (seconds)
+LYRICS_POOL_SIZE = 10  # pooled connections per host
+LYRICS_BREAKER_FAILURES = 5  # consecutive failures before calls stop
+LYRICS_BREAKER_RESET = 60  # seconds before a trial call
+LYRICS_NEGATIVE_TTL = 7 * 86400
+LYRICS_BACKFILL_WORKERS = 4
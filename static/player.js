@@ -44,8 +44,85 @@ class MusicPlayer {
     
     loadSong(song) {
         this.currentSong = song;
-        this.audio.src = song.audio_url;
+        this.audio.src = this.streamUrl(song.audio_url);
         this.updateSongInfo();
+        this.loadWaveform(song);
+    }
+    
+    // Fetch the precomputed peaks (one int8 per bucket) and draw them in the progress bar
+    loadWaveform(song) {
+        this.peaks = null;
+        $('.progress-bar').removeClass('has-waveform');
+        if (!song.waveform_url) return;
+        
+        fetch(song.waveform_url)
+            .then(response => response.ok ? response.arrayBuffer() : null)
+            .then(buffer => {
+                if (!buffer || this.currentSong !== song) return;
+                this.peaks = new Int8Array(buffer);
+                $('.progress-bar').addClass('has-waveform');
+                this.drawWaveform(0);
+            })
+            .catch(() => {});
+    }
+    
+    drawWaveform(fraction) {
+        const bar = document.querySelector('.progress-bar');
+        if (!this.peaks || !bar) return;
+        
+        let canvas = bar.querySelector('canvas.waveform');
+        if (!canvas) {
+            canvas = document.createElement('canvas');
+            canvas.className = 'waveform';
+            bar.prepend(canvas);
+        }
+        const ratio = window.devicePixelRatio || 1;
+        const width = bar.clientWidth * ratio;
+        const height = bar.clientHeight * ratio;
+        if (canvas.width !== width || canvas.height !== height) {
+            canvas.width = width;
+            canvas.height = height;
+        }
+        
+        const ctx = canvas.getContext('2d');
+        const styles = getComputedStyle(document.documentElement);
+        const played = styles.getPropertyValue('--primary') || '#6366f1';
+        const unplayed = styles.getPropertyValue('--gray-200') || '#e5e7eb';
+        const columns = Math.max(1, Math.floor(width / (2 * ratio)));
+        const step = this.peaks.length / columns;
+        
+        ctx.clearRect(0, 0, width, height);
+        for (let i = 0; i < columns; i++) {
+            // Loudest bucket under this column
+            let peak = 0;
+            for (let j = Math.floor(i * step); j < Math.floor((i + 1) * step); j++) {
+                peak = Math.max(peak, this.peaks[j]);
+            }
+            const barHeight = Math.max(ratio, (peak / 127) * height);
+            ctx.fillStyle = i / columns < fraction ? played : unplayed;
+            ctx.fillRect(i * 2 * ratio, (height - barHeight) / 2, ratio, barHeight);
+        }
+    }
+    
+    // Pick a rendition to suit the connection and the codecs the browser plays
+    streamUrl(url) {
+        const codecs = [];
+        if (this.audio.canPlayType('audio/ogg; codecs="opus"')) codecs.push('opus');
+        if (this.audio.canPlayType('audio/mp4; codecs="mp4a.40.2"')) codecs.push('aac');
+        
+        const connection = navigator.connection;
+        let quality = 'high';
+        if (connection) {
+            if (connection.saveData || ['slow-2g', '2g'].includes(connection.effectiveType)) {
+                quality = 'low';
+            } else if (connection.effectiveType === '3g' || connection.downlink < 2) {
+                quality = 'medium';
+            }
+        }
+        
+        if (!codecs.length) return url;
+        const separator = url.includes('?') ? '&' : '?';
+        return `${url}${separator}quality=${quality}&codecs=${codecs.join(',')}`;
     }
     
     play() {
@@ -83,6 +160,7 @@ class MusicPlayer {
     updateProgress() {
         const percent = (this.audio.currentTime / this.audio.duration) * 100;
         $('.progress-fill').css('width', percent + '%');
+        this.drawWaveform(this.audio.currentTime / this.audio.duration);
         
         // Update time display
         const current = this.formatTime(this.audio.currentTime);
@@ -145,11 +223,50 @@ function setupLikeButtons() {
                         button.find('i').removeClass('fas').addClass('far');
                     }
                 }
+            },
+            error: function() {
+                // Offline: remember the toggle and replay it when we reconnect
+                queueLikeToggle(songId, action);
+                button.toggleClass('liked');
+                button.find('i').toggleClass('far fas');
             }
         });
     });
 }
 
+// Offline like queue, synced through the bulk endpoint
+const PENDING_LIKES_KEY = 'pendingLikeToggles';
+
+function queueLikeToggle(songId, action) {
+    const pending = JSON.parse(localStorage.getItem(PENDING_LIKES_KEY) || '[]');
+    pending.push({ song_id: songId, action: action });
+    localStorage.setItem(PENDING_LIKES_KEY, JSON.stringify(pending));
+}
+
+function syncPendingLikes() {
+    const pending = JSON.parse(localStorage.getItem(PENDING_LIKES_KEY) || '[]');
+    if (pending.length === 0) return;
+    
+    $.ajax({
+        url: '/like-songs/',
+        method: 'POST',
+        data: JSON.stringify({ toggles: pending }),
+        contentType: 'application/json',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        success: function(response) {
+            if (!response.success) return;
+            localStorage.removeItem(PENDING_LIKES_KEY);
+            response.results.forEach(function(result) {
+                const button = $(`.like-button[data-song-id="${result.song_id}"]`);
+                button.toggleClass('liked', result.is_liked);
+                button.find('.like-count').text(result.likes_count);
+            });
+        }
+    });
+}
+
 // Add to playlist functionality
 function setupPlaylistButtons() {
     $('.add-to-playlist').click(function() {
@@ -159,6 +276,50 @@ function setupPlaylistButtons() {
     });
 }
 
+// Search typeahead
+function setupAutocomplete() {
+    const input = $('.search-form input[name="q"]');
+    const suggestions = $('#search-suggestions');
+    const url = input.data('autocomplete-url');
+    let timer = null;
+    
+    input.on('input', function(event) {
+        // Typing reports an inputType; picking a datalist option doesn't, or
+        // reports a replacement. Only a pick goes straight to its page
+        const inputType = event.originalEvent && event.originalEvent.inputType;
+        if (!inputType || inputType === 'insertReplacementText') {
+            const value = input.val();
+            const picked = suggestions.children('option').filter(function() {
+                return this.value === value;
+            });
+            if (picked.length) {
+                clearTimeout(timer);
+                window.location = picked.data('url');
+                return;
+            }
+        }
+        
+        const query = input.val().trim();
+        clearTimeout(timer);
+        if (!query) return;
+        timer = setTimeout(function() {
+            $.getJSON(url, { q: query }, function(response) {
+                suggestions.empty();
+                const seen = new Set();
+                response.results.forEach(function(result) {
+                    // Option values must be unique for a pick to name one target
+                    let value = `${result.label} (${result.type})`;
+                    if (seen.has(value)) {
+                        value = `${result.label} (${result.type} #${result.id})`;
+                    }
+                    seen.add(value);
+                    suggestions.append($('<option>').val(value).attr('data-url', result.url));
+                });
+            });
+        }, 120);
+    });
+}
+
 // Cookie helper function
 function getCookie(name) {
     let cookieValue = null;
@@ -178,5 +339,8 @@ function getCookie(name) {
 // Initialize when document is ready
 $(document).ready(function() {
     setupLikeButtons();
+    syncPendingLikes();
+    setupAutocomplete();
+    window.addEventListener('online', syncPendingLikes);
     setupPlaylistButtons();
 });
\ No newline at end of file